@@ -0,0 +1,289 @@
+"""
+Database micro-benchmarks for the persistence layer
+
+Seeds a throwaway database and times the hot database calls, writing JSON results.
+
+    python -m benchmarks.db_bench --scale 0.01 --output bench.json
+    python -m benchmarks.db_bench --scale 0.01 --compare bench.json
+
+--scale 1 seeds 100k users, 10M chat_history rows and 1M transactions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from modules.database import archive, connection
+
+FULL_SCALE = {'users': 100_000, 'chat_history': 10_000_000, 'transactions': 1_000_000, 'chats': 500}
+
+# Rows inserted per seeding statement
+SEED_CHUNK = 500_000
+
+def _seed_counts(scale: float) -> dict:
+    """Row counts for a given fraction of the full-size dataset"""
+    return {table: max(1, int(count * scale)) for table, count in FULL_SCALE.items()}
+
+def _insert_sequence(conn, lo: int, hi: int, query: str):
+    """Run an INSERT ... SELECT over n = lo..hi using a recursive CTE"""
+    conn.execute(f'''
+        WITH RECURSIVE seq(n) AS (SELECT ? UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+        {query}
+    ''', (lo, hi))
+
+def seed_database(counts: dict):
+    """Fill an empty database with users, chats, history and transactions"""
+    users, chats = counts['users'], counts['chats']
+    with connection.get_db() as conn:
+        _insert_sequence(conn, 1, users, '''
+            INSERT INTO users (user_id, username, first_name, last_name, timezone, degencoins)
+            SELECT n, 'user' || n, 'Name' || n, NULL,
+                   CASE WHEN n % 5 = 0 THEN 'Europe/London' END, 1000 + n % 5000
+            FROM seq
+        ''')
+        _insert_sequence(conn, 1, chats, '''
+            INSERT INTO authorized_chats (chat_id, chat_title, chat_type, approved_by)
+            SELECT -1000000 - n, 'Chat ' || n, 'supergroup', 1 FROM seq
+        ''')
+
+    # Each user talks in two neighbouring chats, spread over the last 80 days
+    for lo in range(1, counts['chat_history'] + 1, SEED_CHUNK):
+        hi = min(lo + SEED_CHUNK - 1, counts['chat_history'])
+        with connection.get_db() as conn:
+            _insert_sequence(conn, lo, hi, f'''
+                INSERT INTO chat_history (
+                    message_id, user_id, username, first_name, chat_id, chat_title, chat_type,
+                    message_text, message_type, timestamp
+                )
+                SELECT n, u, 'user' || u, 'Name' || u, -1000000 - 1 - ((u + n % 2) % {chats}), 'Chat',
+                       'supergroup', 'benchmark message ' || n || ' about topic ' || (n % 997), 'text',
+                       datetime('now', '-' || (n % 80) || ' days')
+                FROM (SELECT n, (n * 7919) % {users} + 1 AS u FROM seq)
+            ''')
+
+    for lo in range(1, counts['transactions'] + 1, SEED_CHUNK):
+        hi = min(lo + SEED_CHUNK - 1, counts['transactions'])
+        with connection.get_db() as conn:
+            _insert_sequence(conn, lo, hi, f'''
+                INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, description)
+                SELECT n % {users} + 1, (n * 31) % {users} + 1, n % 500 + 1,
+                       CASE n % 3 WHEN 0 THEN 'tip' WHEN 1 THEN 'fight_bet' ELSE 'daily' END, 'seed'
+                FROM seq
+            ''')
+
+    with connection.get_db() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO chat_members (chat_id, user_id, first_seen, last_seen, message_count)
+            SELECT chat_id, user_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+            FROM chat_history GROUP BY chat_id, user_id
+        ''')
+    with connection.get_db() as conn:
+        conn.execute('ANALYZE')
+
+def _summarize(samples_ns: list, total_ns: int) -> dict:
+    """Throughput and latency percentiles for one benchmark"""
+    samples = sorted(samples_ns)
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+    return {
+        'ops': len(samples),
+        'total_s': round(total_ns / 1e9, 4),
+        'ops_per_sec': round(len(samples) / (total_ns / 1e9), 1),
+        'p50_us': round(percentile(0.50), 1),
+        'p90_us': round(percentile(0.90), 1),
+        'p99_us': round(percentile(0.99), 1),
+        'max_us': round(samples[-1] / 1000, 1),
+    }
+
+def time_calls(func, args_list: list, before=None) -> dict:
+    """Time func(*args) for every argument tuple; before(*args) runs untimed"""
+    samples = []
+    clock = time.perf_counter_ns
+    for args in args_list:
+        if before:
+            before(*args)
+        start = clock()
+        func(*args)
+        samples.append(clock() - start)
+    return _summarize(samples, sum(samples))
+
+def time_async_calls(func, args_list: list, finish=None) -> dict:
+    """Time awaited func(*args) calls; finish() is awaited at the end and counted in the total"""
+    async def run():
+        samples = []
+        clock = time.perf_counter_ns
+        began = clock()
+        for args in args_list:
+            start = clock()
+            await func(*args)
+            samples.append(clock() - start)
+        if finish:
+            await finish()
+        return samples, clock() - began
+    samples, total_ns = asyncio.run(run())
+    return _summarize(samples, total_ns)
+
+def _make_update(rng: random.Random, counts: dict, message_id: int):
+    """A realistic incoming group message"""
+    from telegram import Chat, Message, Update, User as TelegramUser
+    user_id = rng.randint(1, counts['users'])
+    chat = Chat(-1000001 - rng.randrange(counts['chats']), Chat.SUPERGROUP, title='Bench chat')
+    user = TelegramUser(user_id, f'Name{user_id}', False, username=f'user{user_id}')
+    message = Message(message_id, datetime.now(timezone.utc), chat, from_user=user,
+                      text=f'benchmark message {message_id}')
+    return Update(message_id, message=message)
+
+def run_benchmarks(counts: dict, iterations: int, seed: int) -> dict:
+    """Run every benchmark and return results keyed by name"""
+    from modules.auth import authorization
+    from modules.database import models
+    from modules.database.history_buffer import chat_history_buffer
+    from modules.handlers.message_handler import save_enhanced_chat_message
+
+    rng = random.Random(seed)
+    users, chats = counts['users'], counts['chats']
+    user_ids = [(rng.randint(1, users),) for _ in range(iterations)]
+    results = {}
+
+    def profile(user_id, suffix=''):
+        return (user_id, f'user{user_id}{suffix}', f'Name{user_id}', None)
+
+    # Steady state: most messages come from users whose profile has not changed
+    results['upsert_user_unchanged'] = time_calls(models.upsert_user, [profile(u) for u, in user_ids])
+    results['upsert_user_changed'] = time_calls(
+        models.upsert_user, [profile(u, f'_{i}') for i, (u,) in enumerate(user_ids)]
+    )
+
+    for user_id, in user_ids:
+        models.get_user_data(user_id)
+    results['get_user_data_cached'] = time_calls(models.get_user_data, user_ids)
+    results['get_user_data_uncached'] = time_calls(
+        models.get_user_data, user_ids, before=models.invalidate_user_cache
+    )
+
+    updates = [(_make_update(rng, counts, 10_000_000 + i),) for i in range(iterations)]
+    results['save_enhanced_chat_message'] = time_async_calls(
+        save_enhanced_chat_message, updates, finish=chat_history_buffer.flush
+    )
+
+    results['is_chat_authorized'] = time_calls(
+        authorization.is_chat_authorized,
+        [(-1000001 - rng.randrange(chats * 2),) for _ in range(iterations)]
+    )
+
+    results['get_chat_user_timezones'] = time_calls(
+        models.get_chat_user_timezones,
+        [(-1000001 - rng.randrange(chats),) for _ in range(max(1, iterations // 10))]
+    )
+
+    results['log_transaction'] = time_calls(
+        models.log_transaction,
+        [(rng.randint(1, users), rng.randint(1, users), rng.randint(1, 500), 'tip', 'bench')
+         for _ in range(iterations)]
+    )
+    return results
+
+def _git_commit() -> str:
+    """Current commit of the working tree, if available"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Print per-benchmark changes; returns names that regressed past threshold"""
+    regressions = []
+    print(f"{'benchmark':32} {'p50 us':>18} {'p99 us':>18} {'ops/s':>20}")
+    for name, now in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before:
+            print(f"{name:32} (new)")
+            continue
+        def cell(key):
+            change = (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            return f"{now[key]:>9} ({change:+6.1f}%)", change
+        p50, p50_change = cell('p50_us')
+        p99, _ = cell('p99_us')
+        ops, ops_change = cell('ops_per_sec')
+        flag = ''
+        if p50_change > threshold or -ops_change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:32} {p50} {p99} {ops}{flag}")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=0.01,
+                        help='fraction of the full dataset to seed (default 0.01)')
+    parser.add_argument('--iterations', type=int, default=2000, help='calls per benchmark')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for call arguments')
+    parser.add_argument('--db', help='database file to seed, or reuse if it is already seeded')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent slowdown reported as a regression (default 10)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='db_bench_')
+    db_path = args.db or os.path.join(workdir, 'bench.db')
+    connection.DATABASE_FILE = db_path
+    archive.CHAT_HISTORY_ARCHIVE_DIR = os.path.join(workdir, 'archive')
+
+    from modules.database import models
+    counts = _seed_counts(args.scale)
+    models.init_database()
+
+    with connection.get_db() as conn:
+        seeded = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] > 0
+    seed_seconds = None
+    if not seeded:
+        start = time.perf_counter()
+        seed_database(counts)
+        seed_seconds = round(time.perf_counter() - start, 1)
+        models.load_user_directory()
+        models.load_authorized_chats()
+
+    results = run_benchmarks(counts, args.iterations, args.seed)
+    report = {
+        'commit': _git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'scale': args.scale,
+        'rows': counts,
+        'iterations': args.iterations,
+        'seed_seconds': seed_seconds,
+        'results': results,
+    }
+
+    from modules.database.async_db import shutdown_db_thread
+    shutdown_db_thread()
+    connection.close_all_connections()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print(f"warning: baseline scale {baseline.get('scale')} differs from {args.scale}")
+        return 1 if compare(baseline, report, args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
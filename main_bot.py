@@ -3,19 +3,39 @@ Enhanced Mini Bot - Modular Version
 Main bot entry point with proper topic group support
 """
 import re
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters
+from telegram import Update
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, ConversationHandler,
+    TypeHandler, filters
+)
 
 # Configuration
 from config.settings import validate_config, BOT_TOKEN, RAPIDAPI_KEY, OPENAI_API_KEY, ADMIN_USER_ID
 from config.logging_config import logger
 
 # Database
-from modules.database.models import init_database
+from modules.database.models import init_database, DRAW_PURGE_INTERVAL, AUTHORIZED_CHATS_REFRESH_INTERVAL
+from modules.database.connection import close_all_connections
+from modules.database.async_db import shutdown_db_thread
+from modules.database.history_buffer import chat_history_buffer, HISTORY_FLUSH_INTERVAL_MS
+from modules.database.archive import ARCHIVE_INTERVAL
+from modules.database.export import EXPORT_INTERVAL, parquet_available
+from modules.database import async_db
+
+# Background jobs
+from utils.background import start_background_task, stop_background_tasks, run_periodic
+from utils.loop_monitor import monitor_loop_lag
+from utils.send_queue import send_queue
 
 # Handlers
 from modules.handlers.message_handler import handle_message, save_enhanced_chat_message
 from modules.handlers.callback_handler import handle_callback_query
-from modules.handlers.access_handler import request_access
+from modules.handlers.access_handler import request_access, revoke_access
+from modules.auth.authorization import handle_my_chat_member
+from modules.handlers.pre_dispatch import pre_dispatch, PRE_DISPATCH_GROUP
+from modules.auth.rate_limiting import (
+    purge_expired_rate_limits, close_rate_limit_store, RATE_LIMIT_PURGE_INTERVAL
+)
 
 # Commands
 from modules.commands.start import start_command
@@ -30,6 +50,9 @@ from modules.commands.fight import fight_arena
 from modules.commands.tip import tip_degencoins
 from modules.commands.balance import balance_command
 from modules.commands.gpt import ask_gpt
+from modules.commands.search import search_command
+from modules.commands.export import export_command
+from modules.commands.stats import stats_command
 
 # Image handlers
 from modules.commands.image_commands import (
@@ -48,6 +71,47 @@ from modules.commands.nsfw_commands import (
     fetch_image_command, increment_cunt_counter
 )
 
+async def on_startup(application: Application) -> None:
+    """Start background jobs once the event loop is running"""
+    start_background_task(monitor_loop_lag(), name='loop_lag_monitor')
+    start_background_task(
+        run_periodic(HISTORY_FLUSH_INTERVAL_MS / 1000, chat_history_buffer.flush),
+        name='chat_history_flush'
+    )
+    start_background_task(
+        run_periodic(ARCHIVE_INTERVAL, async_db.archive_old_chat_history),
+        name='chat_history_archive'
+    )
+    start_background_task(
+        run_periodic(DRAW_PURGE_INTERVAL, async_db.purge_draw_history),
+        name='draw_history_purge'
+    )
+    start_background_task(
+        run_periodic(AUTHORIZED_CHATS_REFRESH_INTERVAL, async_db.load_authorized_chats),
+        name='authorized_chats_refresh'
+    )
+    start_background_task(
+        run_periodic(RATE_LIMIT_PURGE_INTERVAL, async_db.run_in_reader, purge_expired_rate_limits),
+        name='rate_limit_purge'
+    )
+    if parquet_available():
+        start_background_task(
+            run_periodic(EXPORT_INTERVAL, async_db.export_analytics),
+            name='analytics_export'
+        )
+
+async def on_stop(application: Application) -> None:
+    """Drain outbound messages while the bot's HTTP client is still open"""
+    await send_queue.close()
+
+async def on_shutdown(application: Application) -> None:
+    """Release shared resources when the bot stops"""
+    await stop_background_tasks()
+    await chat_history_buffer.flush()
+    shutdown_db_thread()
+    close_all_connections()
+    close_rate_limit_store()
+
 def main() -> None:
     """Main function to run the bot"""
     try:
@@ -58,16 +122,20 @@ def main() -> None:
         init_database()
 
         # Create application
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = Application.builder().token(BOT_TOKEN).post_init(on_startup).post_stop(on_stop).post_shutdown(on_shutdown).build()
 
         # Store API keys in bot_data for access in handlers
         application.bot_data['rapidapi_key'] = RAPIDAPI_KEY
         application.bot_data['openai_key'] = OPENAI_API_KEY
         application.bot_data['admin_user_id'] = ADMIN_USER_ID
 
+        # Authorization and user upsert, resolved once per update before any handler
+        application.add_handler(TypeHandler(Update, pre_dispatch), group=PRE_DISPATCH_GROUP)
+
         # Basic commands
         application.add_handler(CommandHandler("start", start_command))
         application.add_handler(CommandHandler("request_access", request_access))
+        application.add_handler(CommandHandler("revoke", revoke_access))
 
         # Feature commands
         application.add_handler(CommandHandler("convert", convert_crypto))
@@ -88,6 +156,9 @@ def main() -> None:
         #application.add_handler(CommandHandler("tip", tip_degencoins))
         #application.add_handler(CommandHandler("balance", balance_command))
         application.add_handler(CommandHandler("ask", ask_gpt))
+        application.add_handler(CommandHandler("search", search_command))
+        application.add_handler(CommandHandler("export", export_command))
+        application.add_handler(CommandHandler("stats", stats_command))
 
         # Image commands
         application.add_handler(CommandHandler("draw_me", handle_draw_me_command))
@@ -107,6 +178,9 @@ def main() -> None:
         #application.add_handler(CommandHandler("porn", random_movie_command))
         #application.add_handler(CommandHandler("gimme", fetch_image_command))
 
+        # Keeps the cached admin status of the bot current
+        application.add_handler(ChatMemberHandler(handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+
         # Callback query handler for all button interactions
         application.add_handler(CallbackQueryHandler(handle_callback_query))
 
@@ -1,105 +1,103 @@
 """
 Chat authorization and access control
 """
-import sqlite3
+import time
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest, Forbidden
-from modules.database.models import DATABASE_FILE
+from modules.database.models import is_chat_authorized
 from utils.reply_helper import reply_to_message
 
-def is_chat_authorized(chat_id: int) -> bool:
-    """Check if chat is authorized to use the bot"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT chat_id FROM authorized_chats WHERE chat_id = ? AND is_active = 1', (chat_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+# The bot's own member status per chat; my_chat_member updates keep it current between expiries
+BOT_STATUS_TTL = 10 * 60
+BOT_STATUS_CACHE_SIZE = 10000
+_bot_status_cache = {}
 
-def add_authorized_chat(chat_id: int, chat_title: str, chat_type: str, approved_by: int):
-    """Add chat to authorized list"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO authorized_chats (chat_id, chat_title, chat_type, approved_by)
-        VALUES (?, ?, ?, ?)
-    ''', (chat_id, chat_title, chat_type, approved_by))
-    conn.commit()
-    conn.close()
+# An unauthorized chat is told how to get access at most this often; other commands are ignored
+UNAUTHORIZED_NOTICE_INTERVAL = 10 * 60
+_unauthorized_notices = {}
 
-def save_access_request(chat_id: int, chat_title: str, chat_type: str, requested_by: int, username: str, message: str):
-    """Save chat access request to database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO chat_access_requests (chat_id, chat_title, chat_type, requested_by, requested_by_username, request_message)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (chat_id, chat_title, chat_type, requested_by, username, message))
-    conn.commit()
-    conn.close()
+def _remember(cache: dict, key, value):
+    """Store an entry, dropping the oldest once the cache is full"""
+    cache.pop(key, None)
+    cache[key] = value
+    if len(cache) > BOT_STATUS_CACHE_SIZE:
+        del cache[next(iter(cache))]
 
-def update_access_request_status(request_id: int, status: str, processed_by: int):
-    """Update access request status"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE chat_access_requests 
-        SET status = ?, processed_at = CURRENT_TIMESTAMP, processed_by = ?
-        WHERE id = ?
-    ''', (status, processed_by, request_id))
-    conn.commit()
-    conn.close()
+async def get_bot_status(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> Optional[str]:
+    """The bot's member status in a chat, or None if it cannot be read"""
+    cached = _bot_status_cache.get(chat_id)
+    if cached and time.monotonic() - cached[1] < BOT_STATUS_TTL:
+        return cached[0]
+    
+    try:
+        status = (await context.bot.get_chat_member(chat_id, context.bot.id)).status
+    except (BadRequest, Forbidden):
+        status = None
+    _remember(_bot_status_cache, chat_id, (status, time.monotonic()))
+    return status
 
-def get_access_request(request_id: int):
-    """Get access request by ID"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM chat_access_requests WHERE id = ?', (request_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+async def handle_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Track the bot being promoted, demoted, added or removed"""
+    change = update.my_chat_member
+    _remember(_bot_status_cache, change.chat.id, (change.new_chat_member.status, time.monotonic()))
+    # A fresh promotion deserves fresh instructions
+    _unauthorized_notices.pop(change.chat.id, None)
 
-async def check_chat_authorization(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Check if the current chat is authorized to use the bot"""
+def is_update_authorized(update: Update) -> bool:
+    """Whether the update comes from a private or authorized chat"""
     chat = update.effective_chat
     if not chat:
         return False
     
     # Allow private chats always
-    if chat.type == 'private':
+    return chat.type == 'private' or is_chat_authorized(chat.id)
+
+def is_context_authorized(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """The pre-dispatch stage's authorization result, resolved directly if the stage did not run"""
+    authorized = getattr(context, 'chat_authorized', None)
+    if authorized is None:
+        authorized = is_update_authorized(update)
+    return authorized
+
+async def check_chat_authorization(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Check if the current chat is authorized to use the bot"""
+    if is_context_authorized(update, context):
         return True
     
-    # Check if chat is authorized
-    if not is_chat_authorized(chat.id):
-        # Check if bot is admin (required for group usage)
-        try:
-            bot_member = await context.bot.get_chat_member(chat.id, context.bot.id)
-            if bot_member.status not in ['administrator', 'creator']:
-                await reply_to_message(update, context,
-                    "❌ **Bot Access Required**\n\n"
-                    "I need to be an **administrator** in this chat to function properly.\n"
-                    "Please make me an admin with the following permissions:\n"
-                    "• Read messages\n"
-                    "• Send messages\n"
-                    "• Delete messages\n\n"
-                    "After making me admin, use `/request_access` to request authorization.",
-                    parse_mode='Markdown'
-                )
-                return False
-        except (BadRequest, Forbidden):
-            pass
-        
+    chat = update.effective_chat
+    if not chat:
+        return False
+    
+    last_notice = _unauthorized_notices.get(chat.id)
+    if last_notice and time.monotonic() - last_notice < UNAUTHORIZED_NOTICE_INTERVAL:
+        return False
+    _remember(_unauthorized_notices, chat.id, time.monotonic())
+    
+    # Check if bot is admin (required for group usage)
+    status = await get_bot_status(context, chat.id)
+    if status is not None and status not in ['administrator', 'creator']:
         await reply_to_message(update, context,
-            "🚫 **Unauthorized Chat**\n\n"
-            "This chat is not authorized to use this bot.\n\n"
-            "📝 To request access:\n"
-            "1. Make sure I'm an admin in this chat\n"
-            "2. Use `/request_access` command\n"
-            "3. Wait for admin approval\n\n"
-            "💡 **Note**: I need admin permissions to read and log all messages for audit purposes.",
+            "❌ **Bot Access Required**\n\n"
+            "I need to be an **administrator** in this chat to function properly.\n"
+            "Please make me an admin with the following permissions:\n"
+            "• Read messages\n"
+            "• Send messages\n"
+            "• Delete messages\n\n"
+            "After making me admin, use `/request_access` to request authorization.",
             parse_mode='Markdown'
         )
         return False
     
-    return True
\ No newline at end of file
+    await reply_to_message(update, context,
+        "🚫 **Unauthorized Chat**\n\n"
+        "This chat is not authorized to use this bot.\n\n"
+        "📝 To request access:\n"
+        "1. Make sure I'm an admin in this chat\n"
+        "2. Use `/request_access` command\n"
+        "3. Wait for admin approval\n\n"
+        "💡 **Note**: I need admin permissions to read and log all messages for audit purposes.",
+        parse_mode='Markdown'
+    )
+    return False
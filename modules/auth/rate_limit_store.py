@@ -0,0 +1,143 @@
+"""
+Rate limit state stores: in-process memory or a SQLite file shared by local workers
+"""
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+# Memory store: past the cap the stalest entries go, which can only make a limit more lenient
+RATE_LIMIT_MAX_ENTRIES = 50000
+# Least recently used entries dropped per call if expired, stopping at the first live one.
+# Recency only approximates expiry, so this is opportunistic; the cap and purge() bound memory.
+RATE_LIMIT_GC_BATCH = 2
+
+# How long a worker waits for another worker's check to finish, in seconds
+RATE_LIMIT_BUSY_TIMEOUT = 1.0
+
+def _evaluate(checks: list, states: dict, now: float):
+    """Run each (key, policy) check; returns (wait, refusing scope, new states)"""
+    wait, refused_by = 0.0, None
+    updates = []
+    for key, policy in checks:
+        policy_wait, new_state = policy.evaluate(states.get(key), now)
+        if policy_wait > wait:
+            wait, refused_by = policy_wait, policy.scope
+        updates.append((key, policy, new_state))
+    return wait, refused_by, updates
+
+class MemoryRateLimitStore:
+    """Rate limit state in an LRU table private to this process"""
+
+    def __init__(self):
+        # key -> (expires_at, state), least recently used first
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, checks: List[tuple], now: float, consume: bool = True) -> Tuple[float, Optional[str]]:
+        """
+        Atomically check (key, policy) pairs and, if all allow it, take one call from each.
+        Returns (seconds to wait, scope of the policy that refused).
+        """
+        with self._lock:
+            for _ in range(RATE_LIMIT_GC_BATCH):
+                if not self._states or next(iter(self._states.values()))[0] > now:
+                    break
+                self._states.popitem(last=False)
+
+            states = {key: self._states[key][1] for key, _ in checks if key in self._states}
+            wait, refused_by, updates = _evaluate(checks, states, now)
+            if refused_by or not consume:
+                return wait, refused_by
+
+            for key, policy, new_state in updates:
+                self._states[key] = (policy.expires_at(new_state), new_state)
+                self._states.move_to_end(key)
+            while len(self._states) > RATE_LIMIT_MAX_ENTRIES:
+                self._states.popitem(last=False)
+        return 0.0, None
+
+    def purge(self, now: float) -> int:
+        """Drop every expired entry; returns how many went"""
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._states.items() if expires_at <= now]
+            for key in expired:
+                del self._states[key]
+        return len(expired)
+
+    def close(self):
+        pass
+
+class SQLiteRateLimitStore:
+    """Rate limit state in a SQLite file, so every worker on the host shares the same limits"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """The calling thread's connection, creating the table on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; acquire manages its own transactions
+            conn = sqlite3.connect(self.path, timeout=RATE_LIMIT_BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_state (
+                    key TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_state_expires ON rate_limit_state(expires_at)')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def acquire(self, checks: List[tuple], now: float, consume: bool = True) -> Tuple[float, Optional[str]]:
+        """
+        Atomically check (key, policy) pairs and, if all allow it, take one call from each.
+        Returns (seconds to wait, scope of the policy that refused).
+        """
+        conn = self._connection()
+        keys = [key for key, _ in checks]
+        # IMMEDIATE takes the write lock up front, so no other worker can consume between read and write
+        conn.execute('BEGIN IMMEDIATE' if consume else 'BEGIN')
+        try:
+            rows = conn.execute(
+                f"SELECT key, state FROM rate_limit_state WHERE key IN ({', '.join('?' * len(keys))}) AND expires_at > ?",
+                (*keys, now)
+            ).fetchall()
+            states = {key: tuple(json.loads(state)) for key, state in rows}
+            wait, refused_by, updates = _evaluate(checks, states, now)
+            if consume and not refused_by:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO rate_limit_state (key, state, expires_at) VALUES (?, ?, ?)',
+                    [(key, json.dumps(new_state), policy.expires_at(new_state)) for key, policy, new_state in updates]
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait, refused_by
+
+    def purge(self, now: float) -> int:
+        """Delete every expired row; returns how many went"""
+        return self._connection().execute('DELETE FROM rate_limit_state WHERE expires_at <= ?', (now,)).rowcount
+
+    def close(self):
+        """Close every connection opened by this store"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
@@ -1,50 +1,169 @@
 """
 Rate limiting functionality
 """
+import math
+import sqlite3
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict
+from typing import Optional, Tuple
 from telegram import Update
+from config.settings import RATE_LIMIT_DB
+from modules.auth.rate_limit_store import MemoryRateLimitStore, SQLiteRateLimitStore
+from modules.database.async_db import run_in_db
 from utils.reply_helper import reply_to_message
+from utils.token_bucket import TokenBucket, SlidingWindow
+from config.logging_config import logger
 
-# Rate limiting storage
-user_rate_limits = defaultdict(lambda: defaultdict(float))
+# Policies per action, each scoped to the 'user', the 'chat' or the whole bot ('global').
+# A call must pass every policy of its action and then counts against all of them.
 RATE_LIMITS = {
-    'ask_gpt': 30,  # 30 seconds between GPT requests
-    'fight': 60,    # 1 minute between fights
-    'convert': 10,  # 10 seconds between conversions
-    'tip': 5,       # 5 seconds between tips
-    'draw_me': 20,  # 20 seconds between image generations
-    'show_me': 15,  # 15 seconds between NSFW searches
+    'ask_gpt': (
+        TokenBucket('user', 1, 30),        # 30 seconds between GPT requests
+        SlidingWindow('chat', 20, 600),    # 20 per chat per 10 minutes
+        SlidingWindow('global', 60, 600),  # 60 across all chats per 10 minutes
+    ),
+    'fight': (TokenBucket('user', 1, 60),),    # 1 minute between fights
+    'convert': (TokenBucket('user', 1, 10),),  # 10 seconds between conversions
+    'tip': (TokenBucket('user', 1, 5),),       # 5 seconds between tips
+    'draw_me': (
+        TokenBucket('user', 1, 20),        # 20 seconds between image generations
+        SlidingWindow('chat', 10, 600),    # 10 per chat per 10 minutes
+        SlidingWindow('global', 30, 600),  # 30 across all chats per 10 minutes
+    ),
+    'show_me': (TokenBucket('user', 1, 15),),  # 15 seconds between NSFW searches
 }
 
-def check_rate_limit(user_id: int, action: str) -> bool:
+# Shared by every worker when RATE_LIMIT_DB names a SQLite file, otherwise private to this process
+_store = SQLiteRateLimitStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryRateLimitStore()
+
+# Answers checks while the shared store is locked, so a stuck worker can't take the others down
+_fallback_store = MemoryRateLimitStore()
+
+# How often expired state is deleted from the store
+RATE_LIMIT_PURGE_INTERVAL = 10 * 60
+
+# Keys this process has seen refused -> when they allow calls again. Other workers can only
+# push that time later, so a known denial is answered without asking the shared store.
+RATE_LIMIT_DENIAL_CACHE_SIZE = 10000
+_denied_until = OrderedDict()
+_denied_lock = threading.Lock()
+
+def set_rate_limit_store(store):
+    """Swap in another store, e.g. a SQLiteRateLimitStore shared by several workers"""
+    global _store
+    _store.close()
+    _store = store
+    with _denied_lock:
+        _denied_until.clear()
+
+def close_rate_limit_store():
+    """Close the store's connections"""
+    _store.close()
+
+def purge_expired_rate_limits() -> int:
+    """Delete expired rate limit state; returns entries removed"""
+    now = time.time()
+    with _denied_lock:
+        for key in [key for key, (until, _) in _denied_until.items() if until <= now]:
+            del _denied_until[key]
+    _fallback_store.purge(now)
+    return _store.purge(now)
+
+def _checks_for(user_id: int, action: str, chat_id: Optional[int]) -> list:
+    """(store key, policy) pairs for every policy of an action that applies"""
+    checks = []
+    for index, policy in enumerate(RATE_LIMITS.get(action, ())):
+        if policy.scope == 'user':
+            key = user_id
+        elif policy.scope == 'chat':
+            key = chat_id
+        else:
+            key = 'global'
+        if key is not None:
+            checks.append((f'{action}:{index}:{key}', policy))
+    return checks
+
+def _known_denial(checks: list, now: float) -> Tuple[float, Optional[str]]:
+    """The longest wait this process already knows of for these keys"""
+    wait, refused_by = 0.0, None
+    with _denied_lock:
+        for key, policy in checks:
+            denied = _denied_until.get(key)
+            if denied and denied[0] - now > wait:
+                wait, refused_by = denied[0] - now, denied[1]
+    return wait, refused_by
+
+def _remember_denial(checks: list, refused_by: str, until: float):
+    """Record a refusal from the store for the refusing scope's keys"""
+    with _denied_lock:
+        for key, policy in checks:
+            if policy.scope == refused_by:
+                _denied_until[key] = (until, refused_by)
+                _denied_until.move_to_end(key)
+        while len(_denied_until) > RATE_LIMIT_DENIAL_CACHE_SIZE:
+            _denied_until.popitem(last=False)
+
+def acquire_rate_limit(user_id: int, action: str, chat_id: int = None,
+                       consume: bool = True) -> Tuple[bool, float, Optional[str]]:
+    """
+    Check every policy of an action and, if all allow it, count the call against each.
+    Returns (allowed, seconds to wait, scope of the policy that refused).
+    """
+    checks = _checks_for(user_id, action, chat_id)
+    if not checks:
+        return True, 0.0, None
+
+    now = time.time()
+    wait, refused_by = _known_denial(checks, now)
+    if refused_by:
+        return False, wait, refused_by
+
+    try:
+        wait, refused_by = _store.acquire(checks, now, consume)
+    except sqlite3.OperationalError as e:
+        # Locked or timed out: limit this process on its own rather than refuse or fail the command
+        logger.warning(f"Rate limit store unavailable, using local limits: {e}")
+        wait, refused_by = _fallback_store.acquire(checks, now, consume)
+    if refused_by:
+        _remember_denial(checks, refused_by, now + wait)
+    return refused_by is None, wait, refused_by
+
+def check_rate_limit(user_id: int, action: str, chat_id: int = None) -> bool:
     """Check if user is within rate limit for action"""
-    current_time = time.time()
-    last_used = user_rate_limits[user_id][action]
-    
-    if current_time - last_used < RATE_LIMITS.get(action, 0):
-        return False
-    
-    user_rate_limits[user_id][action] = current_time
-    return True
-
-def get_rate_limit_remaining(user_id: int, action: str) -> int:
+    return acquire_rate_limit(user_id, action, chat_id)[0]
+
+def get_rate_limit_remaining(user_id: int, action: str, chat_id: int = None) -> int:
     """Get remaining seconds for rate limit"""
-    current_time = time.time()
-    last_used = user_rate_limits[user_id][action]
-    limit = RATE_LIMITS.get(action, 0)
-    remaining = limit - (current_time - last_used)
-    return max(0, int(remaining))
+    return math.ceil(acquire_rate_limit(user_id, action, chat_id, consume=False)[1])
 
 async def require_rate_limit(user_id: int, action: str, update: Update, context) -> bool:
     """Check rate limit and show appropriate message"""
-    if not check_rate_limit(user_id, action):
-        remaining = get_rate_limit_remaining(user_id, action)
-        await reply_to_message(update, context,
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    if isinstance(_store, MemoryRateLimitStore):
+        allowed, wait, scope = acquire_rate_limit(user_id, action, chat_id)
+    else:
+        # A shared store may wait on another worker's lock, which must not stall the event loop
+        allowed, wait, scope = await run_in_db(acquire_rate_limit, user_id, action, chat_id)
+    if allowed:
+        return True
+
+    remaining = math.ceil(wait)
+    if scope == 'global':
+        text = (
+            f"⏳ **Busy**\n\n"
+            f"`/{action}` is in heavy use right now. Please try again in **{remaining} seconds**."
+        )
+    elif scope == 'chat':
+        text = (
+            f"⏳ **Rate Limit**\n\n"
+            f"This chat has used `/{action}` a lot recently. Please wait **{remaining} seconds**."
+        )
+    else:
+        text = (
             f"⏳ **Rate Limit**\n\n"
             f"Please wait **{remaining} seconds** before using `/{action}` again.\n\n"
-            f"This helps prevent spam and manages API costs.",
-            parse_mode='Markdown'
+            f"This helps prevent spam and manages API costs."
         )
-        return False
-    return True
\ No newline at end of file
+    await reply_to_message(update, context, text, parse_mode='Markdown')
+    return False
@@ -2,7 +2,7 @@
 Balance and economy commands
 """
 from modules.auth.authorization import check_chat_authorization
-from modules.database.models import get_user_data, upsert_user
+from modules.database import async_db
 from utils.reply_helper import reply_to_message
 
 async def balance_command(update, context):
@@ -11,18 +11,18 @@ async def balance_command(update, context):
         return
     
     user_id = update.effective_user.id
-    user_data = get_user_data(user_id)
+    balance = await async_db.get_balance(user_id)
     
-    if not user_data:
-        upsert_user(user_id, update.effective_user.username, 
-                   update.effective_user.first_name, update.effective_user.last_name)
-        user_data = get_user_data(user_id)
+    if balance is None:
+        await async_db.upsert_user(user_id, update.effective_user.username, 
+                                   update.effective_user.first_name, update.effective_user.last_name)
+        balance = await async_db.get_balance(user_id)
     
     username = update.effective_user.first_name or update.effective_user.username or "Unknown"
     
     await reply_to_message(update, context,
         f"🪙 **{username}'s Wallet**\n\n"
-        f"💰 Balance: **{user_data['degencoins']} degencoins**\n\n"
+        f"💰 Balance: **{balance} degencoins**\n\n"
         f"💡 Use `/tip <username> <amount>` to share with others!",
         parse_mode='Markdown'
     )
@@ -3,7 +3,6 @@ Bet calculator commands with topic support
 """
 from modules.auth.authorization import check_chat_authorization
 from utils.reply_helper import reply_to_message
-from utils.user_helper import ensure_user_in_database
 
 def format_number(n):
     """Format number with appropriate suffixes."""
@@ -36,9 +35,6 @@ async def calculate_bet(update, context):
     if not await check_chat_authorization(update, context):
         return
     
-    # Ensure user exists in database
-    ensure_user_in_database(update)
-    
     if len(context.args) != 3:
         await reply_to_message(update, context,
             "Usage: `/bet <base_bet> <multiplier> <increase_%>`\n\n"
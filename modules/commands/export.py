@@ -0,0 +1,48 @@
+"""
+Admin export of a chat's history as CSV
+"""
+import tempfile
+from modules.database import async_db
+from modules.database.export import write_chat_history_csv
+from utils.reply_helper import reply_to_message, reply_document
+from config.logging_config import logger
+
+# Exports stay in memory up to this size, then spill to a temporary file
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+# Largest document a bot may upload
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+async def export_command(update, context):
+    """Send a chat's full history as gzipped CSV: /export [chat_id] (admin only)"""
+    if update.effective_user.id != context.bot_data.get('admin_user_id'):
+        return
+
+    try:
+        chat_id = int(context.args[0]) if context.args else update.effective_chat.id
+    except ValueError:
+        await reply_to_message(update, context, "Usage: `/export [chat_id]`", parse_mode='Markdown')
+        return
+
+    await reply_to_message(update, context, f"📦 Exporting chat history for {chat_id}...")
+
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as out:
+        try:
+            rows = await async_db.run_in_reader(write_chat_history_csv, chat_id, out)
+        except Exception as e:
+            logger.error(f"Chat history export for {chat_id} failed: {e}")
+            await reply_to_message(update, context, f"❌ Export failed: {e}")
+            return
+
+        size = out.tell()
+        if not rows:
+            await reply_to_message(update, context, f"❌ No chat history stored for {chat_id}.")
+            return
+        if size > TELEGRAM_UPLOAD_LIMIT:
+            await reply_to_message(update, context,
+                f"❌ Export is {size // (1024 * 1024)} MB, over Telegram's 50 MB upload limit.")
+            return
+
+        out.seek(0)
+        await reply_document(update, context, document=out, filename=f"chat_{chat_id}_history.csv.gz",
+                             caption=f"📦 {rows} messages from {chat_id}")
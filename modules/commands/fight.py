@@ -4,17 +4,23 @@ Turn-Based AI-Powered Fight Arena with Damage System
 import asyncio
 import random
 import time
+from collections import deque
 import openai
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
 from modules.auth.authorization import check_chat_authorization
-from modules.database.models import get_user_data, update_user_degencoins, log_transaction, get_user_by_username
+from modules.database import async_db
+from modules.economy.ledger import InsufficientFunds
 from utils.reply_helper import reply_to_message
-from utils.user_helper import ensure_user_in_database
+from utils.live_message import LiveMessage
 from config.logging_config import logger
 
 # Global storage for active fights
 ACTIVE_FIGHTS = {}
 
+# Actions shown on the live battle message, and on the final one
+BATTLE_LOG_LINES = 6
+FINAL_LOG_LINES = 4
+
 # Weird weapons and scenarios for AI to use
 WEIRD_WEAPONS = [
     "inflatable rubber chicken", "disco ball on a stick", "banana launcher", 
@@ -95,6 +101,7 @@ class TurnBasedFight:
         self.current_turn = 0
         self.turn_number = 1
         self.status = "waiting"  # waiting, fighting, finished
+        self.fight_type = "single" if opponent_id else "royale"
         self.message_id = None
         self.battle_message_id = None  # Track the main battle message for updates
         self.created_at = time.time()
@@ -105,6 +112,15 @@ class TurnBasedFight:
         self.pre_generated_events = []  # Store all fight events
         self.current_event = 0
         
+        # Live battle message state, updated per event rather than rebuilt from the whole log
+        self.live_message = None
+        self.recent_actions = deque(maxlen=BATTLE_LOG_LINES)
+        self.hp_lines = {}
+        self.turn_label = None
+        
+        # Users whose entrance fee is still being debited
+        self.joining = set()
+        
         # Add fighters
         self.fighters.append(Fighter(initiator_id, initiator_name))
         if opponent_id:
@@ -122,6 +138,20 @@ class TurnBasedFight:
         self.total_pot += self.entrance_fee
         return True
     
+    def stake_of(self, user_id):
+        """Coins a fighter put into the pot"""
+        if self.fight_type == "single":
+            return self.total_pot // 2
+        return self.bet_amount if user_id == self.fighters[0].user_id else self.entrance_fee
+    
+    def remove_fighter(self, user_id):
+        for fighter in self.fighters:
+            if fighter.user_id == user_id:
+                self.fighters.remove(fighter)
+                self.total_pot -= self.entrance_fee
+                return True
+        return False
+    
     def get_alive_fighters(self):
         return [f for f in self.fighters if f.is_alive]
     
@@ -150,8 +180,6 @@ async def fight_arena(update, context):
     if not await check_chat_authorization(update, context):
         return
     
-    ensure_user_in_database(update)
-    
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     username = update.effective_user.first_name or update.effective_user.username or f"User {user_id}"
@@ -214,13 +242,17 @@ async def start_battle_royale(update, context):
         return
     
     # Check user balance
-    user_data = get_user_data(user_id)
-    if not user_data or user_data['degencoins'] < entrance_fee:
+    balance = await async_db.get_balance(user_id)
+    if balance is None or balance < entrance_fee:
         await reply_to_message(update, context, f"❌ You need {entrance_fee} degencoins to start this battle royale.")
         return
     
     # Deduct entrance fee
-    update_user_degencoins(user_id, user_data['degencoins'] - entrance_fee)
+    try:
+        await async_db.debit(user_id, entrance_fee, 'battle_entry', "Battle royale entrance fee")
+    except InsufficientFunds:
+        await reply_to_message(update, context, f"❌ You need {entrance_fee} degencoins to start this battle royale.")
+        return
     
     # Create battle royale
     fight = TurnBasedFight(chat_id, user_id, username, entrance_fee)
@@ -244,7 +276,8 @@ async def start_battle_royale(update, context):
         f"💡 Others click 'Join Battle' to enter!\n"
         f"⏰ **Auto-start in 60 seconds**",
         reply_markup=reply_markup,
-        parse_mode='Markdown'
+        parse_mode='Markdown',
+        wait=True
     )
     
     fight.message_id = message.message_id
@@ -254,6 +287,16 @@ async def start_battle_royale(update, context):
     if chat_id in ACTIVE_FIGHTS and ACTIVE_FIGHTS[chat_id].status == "waiting":
         await start_turn_based_battle(update, context, ACTIVE_FIGHTS[chat_id])
 
+def get_text_mention_user(update):
+    """Get the Telegram user behind a text_mention entity, if any"""
+    message = update.message
+    if not message or not message.entities:
+        return None
+    for entity in message.entities:
+        if entity.type == MessageEntity.TEXT_MENTION and entity.user:
+            return entity.user
+    return None
+
 async def start_single_fight(update, context):
     """Start a turn-based 1v1 fight"""
     if len(context.args) < 2:
@@ -264,8 +307,13 @@ async def start_single_fight(update, context):
     username = update.effective_user.first_name or update.effective_user.username or f"User {user_id}"
     opponent_mention = context.args[0]
     
+    # Users without a username are mentioned by name, which may span several args
+    mentioned_user = get_text_mention_user(update)
+    if mentioned_user:
+        opponent_mention = mentioned_user.first_name
+    
     try:
-        bet_amount = int(context.args[1])
+        bet_amount = int(context.args[-1] if mentioned_user else context.args[1])
         if bet_amount < 10:
             await reply_to_message(update, context, "❌ Minimum bet is 10 degencoins.")
             return
@@ -277,14 +325,16 @@ async def start_single_fight(update, context):
         return
     
     # Check user balance
-    user_data = get_user_data(user_id)
-    if not user_data or user_data['degencoins'] < bet_amount:
+    balance = await async_db.get_balance(user_id)
+    if balance is None or balance < bet_amount:
         await reply_to_message(update, context, f"❌ You need {bet_amount} degencoins to place this bet.")
         return
     
     # Find opponent
-    opponent_username = opponent_mention.replace('@', '')
-    opponent_data = get_user_by_username(opponent_username)
+    if mentioned_user:
+        opponent_data = await async_db.get_user_data(mentioned_user.id)
+    else:
+        opponent_data = await async_db.get_user_by_username(opponent_mention)
     
     if not opponent_data:
         await reply_to_message(update, context, f"❌ User {opponent_mention} not found. They need to interact with the bot first.")
@@ -299,9 +349,16 @@ async def start_single_fight(update, context):
         await reply_to_message(update, context, f"❌ {opponent_mention} doesn't have enough degencoins for this bet.")
         return
     
-    # Deduct bets from both players
-    update_user_degencoins(user_id, user_data['degencoins'] - bet_amount)
-    update_user_degencoins(opponent_data['user_id'], opponent_data['degencoins'] - bet_amount)
+    # Deduct bets from both players, or neither if one can no longer afford it
+    try:
+        await async_db.settle([
+            (user_id, -bet_amount, 'battle_entry', "1v1 fight bet"),
+            (opponent_data['user_id'], -bet_amount, 'battle_entry', "1v1 fight bet"),
+        ])
+    except InsufficientFunds as e:
+        broke = "You don't" if e.user_id == user_id else f"{opponent_mention} doesn't"
+        await reply_to_message(update, context, f"❌ {broke} have enough degencoins for this bet.")
+        return
     
     # Create and start turn-based fight
     opponent_name = opponent_data.get('first_name') or opponent_data.get('username') or f"User {opponent_data['user_id']}"
@@ -316,10 +373,11 @@ async def start_turn_based_battle(update, context, fight):
     """Start the turn-based combat system"""
     if len(fight.fighters) < 2:
         # Refund if not enough fighters
-        for fighter in fight.fighters:
-            user_data = get_user_data(fighter.user_id)
-            refund = fight.entrance_fee if len(fight.fighters) > 2 else fight.bet_amount // 2
-            update_user_degencoins(fighter.user_id, user_data['degencoins'] + refund)
+        fight.status = "finished"
+        await async_db.settle([
+            (fighter.user_id, fight.entrance_fee, 'battle_refund', "Battle cancelled: not enough fighters")
+            for fighter in fight.fighters
+        ])
         
         await reply_to_message(update, context,
             "❌ **Battle Cancelled**\n\n"
@@ -730,23 +788,28 @@ async def show_fight_opening(update, context, fight):
     
     hp_display = "\n".join([f"🔥 {f.name}: {f.hp}/100 HP" for f in fight.fighters])
     
-    message = await reply_to_message(update, context,
+    opening_text = (
         f"⚔️ **BATTLE** - **STARTING** ⚔️\n\n"
         f"**OPENING:**\n_{opening_event['text']}_\n\n"
         f"**FIGHTER STATUS:**\n{hp_display}\n\n"
-        f"_**Turn 1** starting..._",
-        parse_mode='Markdown'
+        f"_**Turn 1** starting..._"
     )
+    message = await reply_to_message(update, context, opening_text, parse_mode='Markdown', wait=True)
     
     fight.battle_message_id = message.message_id
+    fight.live_message = LiveMessage(context, update.effective_chat.id, message.message_id, opening_text)
     fight.current_event = 1
 
+def format_hp_line(name, hp):
+    """One fighter's line in the live status block"""
+    return f"{'💀' if hp <= 0 else '🔥'} **{name}:** `{hp}/100 HP`"
+
 async def play_fight_sequence(update, context, fight):
     """Play the pre-generated fight by updating the same message"""
     await asyncio.sleep(3)  # Opening pause
     
     battle_log = []
-    current_hp = {f.name: f.hp for f in fight.fighters}
+    fight.hp_lines = {f.name: format_hp_line(f.name, f.hp) for f in fight.fighters}
     
     while fight.current_event < len(fight.pre_generated_events):
         event = fight.pre_generated_events[fight.current_event]
@@ -754,112 +817,98 @@ async def play_fight_sequence(update, context, fight):
         if event['type'] == 'hazard':
             damage_text = " | ".join(event['damage_reports']) if event['damage_reports'] else "**Everyone dodges**"
             battle_log.append(f"⚠️ **HAZARD:** {event['text']} - {damage_text}")
+            fight.recent_actions.append(battle_log[-1])
             
             # Update HP from event
             for name, hp, alive in event['hp_states']:
-                current_hp[name] = hp
+                fight.hp_lines[name] = format_hp_line(name, hp)
             
         elif event['type'] == 'attack':
             crit_marker = " 💥**CRITICAL HIT**" if event['is_crit'] else ""
             defeat_marker = " 💀**KNOCKOUT**" if event['target_defeated'] else ""
             battle_log.append(f"⚔️ **TURN {event['turn']}:** {event['text']}{crit_marker}{defeat_marker}")
+            fight.recent_actions.append(battle_log[-1])
+            fight.turn_label = f"**TURN {event['turn']}**"
             
             # Update HP from event
             for name, hp, alive in event['hp_states']:
-                current_hp[name] = hp
+                fight.hp_lines[name] = format_hp_line(name, hp)
             
         elif event['type'] == 'victory':
             await end_pre_generated_battle(update, context, fight, event, battle_log)
             return
         
         # Update the main battle message
-        await update_battle_message(update, context, fight, battle_log, current_hp)
+        await update_battle_message(fight)
         
         fight.current_event += 1
         await asyncio.sleep(4)  # Slower, more engaging timing
 
-async def update_battle_message(update, context, fight, battle_log, current_hp):
-    """Update the main battle message with current state"""
-    if not fight.battle_message_id:
+async def update_battle_message(fight):
+    """Render the live battle message from the fight's current state"""
+    if not fight.live_message:
         return
     
-    hp_display = "\n".join([
-        f"{'💀' if current_hp[f.name] <= 0 else '🔥'} **{f.name}:** `{current_hp[f.name]}/100 HP`"
-        for f in fight.fighters
-    ])
-    
-    # Keep only last 6 log entries to avoid message length issues
-    recent_log = battle_log[-6:] if len(battle_log) > 6 else battle_log
-    log_text = "\n".join(recent_log) if recent_log else "_Battle starting..._"
-    
-    # Get current turn number from latest event
-    current_turn = "**STARTING**"
-    if battle_log:
-        for entry in reversed(recent_log):
-            if "TURN" in entry:
-                turn_match = entry.split("TURN ")[1].split(":")[0] if "TURN " in entry else None
-                if turn_match:
-                    current_turn = f"**TURN {turn_match}**"
-                    break
+    hp_display = "\n".join(fight.hp_lines[f.name] for f in fight.fighters)
+    log_text = "\n".join(fight.recent_actions) if fight.recent_actions else "_Battle starting..._"
     
+    # Queued behind a slow edit, this frame replaces the pending one; unchanged frames are skipped
+    await fight.live_message.render(
+        f"⚔️ **BATTLE** - {fight.turn_label or '**STARTING**'} ⚔️\n\n"
+        f"**RECENT ACTIONS:**\n{log_text}\n\n"
+        f"**FIGHTER STATUS:**\n{hp_display}",
+        parse_mode='Markdown'
+    )
+
+async def record_fight(fight, winner_id, winner_name, turns_taken, fight_log):
+    """Persist a finished fight to fight history"""
+    participants = [
+        {'user_id': f.user_id, 'name': f.name, 'weapon': f.weapon, 'stake': fight.stake_of(f.user_id)}
+        for f in fight.fighters
+    ]
     try:
-        await context.bot.edit_message_text(
-            chat_id=update.effective_chat.id,
-            message_id=fight.battle_message_id,
-            text=f"⚔️ **BATTLE** - {current_turn} ⚔️\n\n"
-                 f"**RECENT ACTIONS:**\n{log_text}\n\n"
-                 f"**FIGHTER STATUS:**\n{hp_display}",
-            parse_mode='Markdown'
+        await async_db.save_fight_history(
+            fight.fight_type, fight.chat_id, participants, winner_id, winner_name,
+            fight.bet_amount, fight.total_pot, turns_taken, fight.scenario, fight_log
         )
     except Exception as e:
-        logger.warning(f"Failed to update battle message: {e}")
+        logger.error(f"Failed to record fight history: {e}")
 
 async def end_pre_generated_battle(update, context, fight, victory_event, battle_log):
     """End the battle using pre-generated victory"""
     winner_id = victory_event['winner_id']
     winner_name = victory_event['winner']
     
-    # Award prize to winner
-    winner_data = get_user_data(winner_id)
-    old_balance = winner_data['degencoins']
-    new_balance = old_balance + fight.total_pot
-    update_user_degencoins(winner_id, new_balance)
-    
-    # Log transaction
-    log_transaction(
-        fight.fighters[0].user_id,
+    # Award prize to winner, logged as paid by the initiator
+    new_balance = await async_db.credit(
         winner_id,
         fight.total_pot,
         'battle_victory',
-        f"Victory in {len(fight.fighters)}-fighter battle"
+        f"Victory in {len(fight.fighters)}-fighter battle",
+        from_user_id=fight.fighters[0].user_id
     )
+    old_balance = new_balance - fight.total_pot
+    
+    turns_taken = max((e.get('turn', 0) for e in fight.pre_generated_events), default=0)
+    await record_fight(fight, winner_id, winner_name, turns_taken, battle_log)
     
     # Final update to battle message
-    if fight.battle_message_id:
+    if fight.live_message:
         try:
-            # Get final turn count
-            final_turn = "**UNKNOWN**"
-            if battle_log:
-                for entry in reversed(battle_log):
-                    if "TURN" in entry:
-                        turn_match = entry.split("TURN ")[1].split(":")[0] if "TURN " in entry else None
-                        if turn_match:
-                            final_turn = f"**TURN {turn_match}**"
-                            break
+            final_turn = fight.turn_label or "**UNKNOWN**"
             
             # Keep recent actions for final display
-            recent_log = battle_log[-4:] if len(battle_log) > 4 else battle_log
+            recent_log = list(fight.recent_actions)[-FINAL_LOG_LINES:]
             log_text = "\n".join(recent_log) if recent_log else "_No actions recorded_"
             
-            await context.bot.edit_message_text(
-                chat_id=update.effective_chat.id,
-                message_id=fight.battle_message_id,
-                text=f"🏆 **BATTLE COMPLETE** - {final_turn} 🏆\n\n"
-                     f"**FINAL ACTIONS:**\n{log_text}\n\n"
-                     f"**VICTORY:**\n_{victory_event['text']}_\n\n"
-                     f"👑 **CHAMPION:** **{winner_name}**\n"
-                     f"💰 **PRIZE WON:** `{fight.total_pot}` **degencoins**\n"
-                     f"💳 **BALANCE:** `{old_balance:,}` → `{new_balance:,}` **coins**",
+            await fight.live_message.render(
+                f"🏆 **BATTLE COMPLETE** - {final_turn} 🏆\n\n"
+                f"**FINAL ACTIONS:**\n{log_text}\n\n"
+                f"**VICTORY:**\n_{victory_event['text']}_\n\n"
+                f"👑 **CHAMPION:** **{winner_name}**\n"
+                f"💰 **PRIZE WON:** `{fight.total_pot}` **degencoins**\n"
+                f"💳 **BALANCE:** `{old_balance:,}` → `{new_balance:,}` **coins**",
+                final=True,
                 parse_mode='Markdown'
             )
         except Exception as e:
@@ -878,20 +927,17 @@ async def end_battle(update, context, fight):
         del ACTIVE_FIGHTS[fight.chat_id]
         return
     
-    # Award prize to winner
-    winner_data = get_user_data(winner.user_id)
-    old_balance = winner_data['degencoins']
-    new_balance = old_balance + fight.total_pot
-    update_user_degencoins(winner.user_id, new_balance)
-    
-    # Log transaction
-    log_transaction(
-        fight.fighters[0].user_id,  # From initiator
+    # Award prize to winner, logged as paid by the initiator
+    new_balance = await async_db.credit(
         winner.user_id,
         fight.total_pot,
         'battle_victory',
-        f"Victory in {len(fight.fighters)}-fighter battle"
+        f"Victory in {len(fight.fighters)}-fighter battle",
+        from_user_id=fight.fighters[0].user_id
     )
+    old_balance = new_balance - fight.total_pot
+    
+    await record_fight(fight, winner.user_id, winner.name, fight.turn_number, fight.fight_log)
     
     # Generate victory scene
     openai_key = context.bot_data.get('openai_key')
@@ -1010,23 +1056,34 @@ async def handle_fight_callback(update, context):
     fight = ACTIVE_FIGHTS[chat_id]
     
     if data.startswith("fight_join_"):
-        if any(f.user_id == user_id for f in fight.fighters):
+        if fight.status != "waiting":
+            await query.answer("❌ This battle has already started!", show_alert=True)
+            return
+        
+        if user_id in fight.joining or any(f.user_id == user_id for f in fight.fighters):
             await query.answer("❌ You're already in this battle!", show_alert=True)
             return
         
-        if len(fight.fighters) >= 8:
+        if len(fight.fighters) + len(fight.joining) >= 8:
             await query.answer("❌ Battle is full (8 fighters max)!", show_alert=True)
             return
         
-        # Check user balance
-        user_data = get_user_data(user_id)
-        if not user_data or user_data['degencoins'] < fight.entrance_fee:
+        # Hold the place while the debit is awaited so a double click cannot pay twice,
+        # but only seat the fighter once the fee is paid
+        fight.joining.add(user_id)
+        try:
+            await async_db.debit(user_id, fight.entrance_fee, 'battle_entry', "Battle royale entrance fee")
+        except (InsufficientFunds, ValueError):
             await query.answer(f"❌ You need {fight.entrance_fee} degencoins to join!", show_alert=True)
             return
+        finally:
+            fight.joining.discard(user_id)
         
-        # Deduct entrance fee and add to fight
-        update_user_degencoins(user_id, user_data['degencoins'] - fight.entrance_fee)
-        fight.add_fighter(user_id, username)
+        if fight.status != "waiting" or not fight.add_fighter(user_id, username):
+            # The battle started or filled up while the fee was being paid
+            await async_db.credit(user_id, fight.entrance_fee, 'battle_refund', "Battle royale entrance fee refund")
+            await query.answer("❌ This battle is no longer open to join!", show_alert=True)
+            return
         
         # Update message
         fighter_list = "\n".join([f"• {f.name} - {f.weapon}" for f in fight.fighters])
@@ -1051,10 +1108,17 @@ async def handle_fight_callback(update, context):
         )
         
     elif data.startswith("fight_start_"):
+        if fight.status != "waiting":
+            await query.answer("❌ This battle has already started!", show_alert=True)
+            return
+        
         if len(fight.fighters) < 2:
             await query.answer("❌ Need at least 2 fighters to start!", show_alert=True)
             return
         
+        # Claim the start before awaiting so a second click cannot run the battle twice
+        fight.status = "fighting"
+        
         await query.edit_message_text(
             f"⚔️ **BATTLE BEGINNING** ⚔️\n\n"
             f"🥊 {len(fight.fighters)} fighters ready!\n"
@@ -1071,16 +1135,20 @@ async def handle_fight_callback(update, context):
             await query.answer("❌ Only the fight initiator can cancel!", show_alert=True)
             return
         
-        # Refund all participants
-        for fighter in fight.fighters:
-            user_data = get_user_data(fighter.user_id)
-            refund_amount = fight.entrance_fee
-            update_user_degencoins(fighter.user_id, user_data['degencoins'] + refund_amount)
+        if fight.status != "waiting":
+            await query.answer("❌ This battle has already started!", show_alert=True)
+            return
+        
+        # Refund all participants in one batch
+        fight.status = "finished"
+        del ACTIVE_FIGHTS[chat_id]
+        await async_db.settle([
+            (fighter.user_id, fight.entrance_fee, 'battle_refund', "Battle cancelled by initiator")
+            for fighter in fight.fighters
+        ])
         
         await query.edit_message_text(
             f"❌ **Battle Cancelled**\n\n"
             f"All entrance fees have been refunded to participants.",
             parse_mode='Markdown'
-        )
-        
-        del ACTIVE_FIGHTS[chat_id]
\ No newline at end of file
+        )
\ No newline at end of file
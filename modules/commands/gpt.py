@@ -5,7 +5,6 @@ import openai
 from modules.auth.authorization import check_chat_authorization
 from modules.auth.rate_limiting import require_rate_limit
 from utils.reply_helper import reply_to_message
-from utils.user_helper import ensure_user_in_database
 from config.logging_config import logger
 
 async def ask_gpt(update, context):
@@ -13,9 +12,6 @@ async def ask_gpt(update, context):
     if not await check_chat_authorization(update, context):
         return
     
-    # Ensure user exists in database
-    ensure_user_in_database(update)
-    
     if not await require_rate_limit(update.effective_user.id, 'ask_gpt', update, context):
         return
     
@@ -3,15 +3,14 @@ AI Image generation commands with topic support
 """
 import os
 import io
-import sqlite3
 from datetime import datetime
 from telegram import Update
 from PIL import Image, ImageOps
 from modules.auth.authorization import check_chat_authorization
 from modules.auth.rate_limiting import require_rate_limit
 from modules.economy.achievements import check_and_award_achievements
-from modules.database.models import DATABASE_FILE
-from utils.reply_helper import reply_to_message, reply_photo
+from modules.database import async_db
+from utils.reply_helper import reply_to_message, reply_photo, reply_media_group
 from config.logging_config import logger
 
 IMAGE_DIR = "received_images"
@@ -19,6 +18,8 @@ GROUP_IMAGE_DIR = "group_images"
 os.makedirs(IMAGE_DIR, exist_ok=True)
 os.makedirs(GROUP_IMAGE_DIR, exist_ok=True)
 
+DAILY_DRAW_LIMIT = 25
+
 async def handle_draw_me_command(update: Update, context):
     """Handle AI image generation with DALL-E"""
     if not await check_chat_authorization(update, context):
@@ -34,30 +35,22 @@ async def handle_draw_me_command(update: Update, context):
         await reply_to_message(update, context, "Please provide a prompt. Usage: /draw_me <your prompt>")
         return
 
-    # Check daily limit
-    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM draw_requests WHERE user_id = ? AND timestamp >= ?', 
-                  (user_id, today_start))
-    count = cursor.fetchone()[0]
-
-    if count >= 25:
-        await reply_to_message(update, context, "You've reached the daily limit of 25 images. Try again tomorrow.")
-        conn.close()
+    # Claim one of today's images up front; it is given back if generation fails
+    today = datetime.now().strftime('%Y-%m-%d')
+    if not await async_db.reserve_draw_quota(user_id, today, DAILY_DRAW_LIMIT):
+        await reply_to_message(update, context, f"You've reached the daily limit of {DAILY_DRAW_LIMIT} images. Try again tomorrow.")
+        return
+
+    # Get OpenAI client from bot_data
+    openai_key = context.bot_data.get('openai_key')
+    if not openai_key:
+        await async_db.release_draw_quota(user_id, today)
+        await reply_to_message(update, context, "❌ AI image generation not configured.")
         return
 
     await reply_to_message(update, context, "🎨 Generating image, please wait...")
 
     try:
-        # Get OpenAI client from bot_data
-        openai_key = context.bot_data.get('openai_key')
-        if not openai_key:
-            await reply_to_message(update, context, "❌ AI image generation not configured.")
-            conn.close()
-            return
-        
         import openai
         client = openai.OpenAI(api_key=openai_key)
         
@@ -72,12 +65,17 @@ async def handle_draw_me_command(update: Update, context):
         )
 
         image_url = response.data[0].url
-        cursor.execute('INSERT INTO draw_requests (user_id, timestamp) VALUES (?, ?)', 
-                     (user_id, datetime.now()))
-        conn.commit()
+    except Exception as e:
+        logger.error(f"Image generation error: {e}")
+        await async_db.release_draw_quota(user_id, today)
+        await reply_to_message(update, context, f"Failed to generate image: {e}")
+        return
+
+    try:
+        await async_db.log_draw_request(user_id, datetime.now())
 
         # Check for achievements
-        new_achievements = check_and_award_achievements(user_id, 'image_generated')
+        new_achievements = await async_db.run_in_db(check_and_award_achievements, user_id, 'image_generated')
         
         caption = f"🎨 Generated for: {user_input}"
         if new_achievements:
@@ -85,13 +83,11 @@ async def handle_draw_me_command(update: Update, context):
             for achievement in new_achievements:
                 caption += f"\n• {achievement['title']} (+{achievement['reward']} coins)"
 
-        await reply_photo(update, context, photo=image_url, caption=caption)
+        await reply_photo(update, context, photo=image_url, caption=caption, wait=True)
         
     except Exception as e:
-        logger.error(f"Image generation error: {e}")
-        await reply_to_message(update, context, f"Failed to generate image: {e}")
-    finally:
-        conn.close()
+        logger.error(f"Image delivery error: {e}")
+        await reply_to_message(update, context, f"Failed to send image: {e}")
 
 async def handle_draw_multiple_command(update: Update, context):
     """Generate multiple images with DALL-E 2"""
@@ -132,13 +128,13 @@ async def handle_draw_multiple_command(update: Update, context):
         )
 
         if response.status_code == 200:
-            response_data = response.json()
-            for i, image_data in enumerate(response_data['data']):
-                await reply_photo(update, context, 
-                    photo=image_data['url'], 
-                    caption=f"🎨 Image {i+1}/3: {user_input}"
-                )
-            await reply_to_message(update, context, "✅ Images generated successfully!")
+            images = response.json()['data']
+            # One album instead of a message per image
+            await reply_media_group(update, context,
+                photos=[image_data['url'] for image_data in images],
+                captions=[f"🎨 Image {i+1}/{len(images)}: {user_input}" for i in range(len(images))],
+                wait=True
+            )
         else:
             await reply_to_message(update, context, f"Generation failed: {response.status_code} - {response.text}")
     except Exception as e:
@@ -5,16 +5,12 @@ import math
 from modules.auth.authorization import check_chat_authorization
 from modules.auth.rate_limiting import require_rate_limit
 from utils.reply_helper import reply_to_message
-from utils.user_helper import ensure_user_in_database
 
 async def mines_multi_command(update, context):
     """Calculate mines multipliers and probabilities"""
     if not await check_chat_authorization(update, context):
         return
     
-    # Ensure user exists in database
-    ensure_user_in_database(update)
-    
     args = context.args
 
     if len(args) == 2:
@@ -4,13 +4,12 @@ NSFW commands with safety checks and topic support
 """
 import json
 import random
-import sqlite3
 import urllib.parse
 import http.client
 import aiohttp
 from modules.auth.authorization import check_chat_authorization
 from modules.auth.rate_limiting import require_rate_limit
-from modules.database.models import DATABASE_FILE
+from modules.database import async_db
 from utils.reply_helper import reply_to_message, reply_photo
 from config.logging_config import logger
 
@@ -71,7 +70,7 @@ async def search_pornstar_command(update, context):
             
             truncated_message = truncate_caption(message)
             
-            await reply_photo(update, context, photo=profile_img_link, caption=truncated_message, parse_mode='Markdown')
+            await reply_photo(update, context, photo=profile_img_link, caption=truncated_message, parse_mode='Markdown', wait=True)
         else:
             await reply_to_message(update, context, "No results found.")
     except Exception as e:
@@ -128,19 +127,7 @@ async def increment_cunt_counter(update, context):
     
     chat_id = update.message.chat.id
     
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    
-    # Use UPSERT pattern for SQLite
-    cursor.execute('''
-        INSERT INTO cunt_counter (chat_id, count) VALUES (?, 1) 
-        ON CONFLICT(chat_id) DO UPDATE SET count = count + 1
-    ''', (chat_id,))
-    conn.commit()
-
-    cursor.execute('SELECT count FROM cunt_counter WHERE chat_id = ?', (chat_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
+    count = await async_db.increment_cunt_counter(chat_id)
 
     message = f"Word counter - that word has been used {count} times in this chat."
     await reply_to_message(update, context, message)
@@ -0,0 +1,90 @@
+"""
+Full-text chat history search with topic support
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from modules.auth.authorization import check_chat_authorization
+from modules.database import async_db
+from utils.reply_helper import reply_to_message
+
+SEARCH_PAGE_SIZE = 10
+
+def format_search_results(terms, rows, page, has_more, user_id, topic_only):
+    """Build the results text and pagination buttons for one page"""
+    scope = "this topic" if topic_only else "this chat"
+    if not rows:
+        return f"🔍 No messages in {scope} match: {terms}", None
+
+    lines = [f"🔍 Results for: {terms} ({scope}, page {page + 1})\n"]
+    for first_name, username, snippet, timestamp in rows:
+        author = first_name or (f"@{username}" if username else "Unknown")
+        lines.append(f"• {author} ({str(timestamp)[:16]}): {snippet}")
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"search_page_{page - 1}_{user_id}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"search_page_{page + 1}_{user_id}"))
+
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def run_search(search, page):
+    """Fetch one page of results for a stored search"""
+    return await async_db.search_chat_history(
+        search['chat_id'], search['terms'], search['thread_id'],
+        limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE
+    )
+
+async def search_command(update, context):
+    """Search this chat's message history: /search [-t] <terms>"""
+    if not await check_chat_authorization(update, context):
+        return
+
+    args = list(context.args)
+    topic_only = bool(args) and args[0] == '-t'
+    if topic_only:
+        args = args[1:]
+
+    if not args:
+        await reply_to_message(update, context,
+            "🔍 **Search Chat History**\n\n"
+            "Usage: `/search <terms>`\n"
+            "Use `/search -t <terms>` inside a topic to search only that topic.",
+            parse_mode='Markdown'
+        )
+        return
+
+    thread_id = update.message.message_thread_id if topic_only else None
+    search = {
+        'chat_id': update.effective_chat.id,
+        'terms': ' '.join(args),
+        'thread_id': thread_id,
+    }
+    # Remembered so the pagination buttons can fetch further pages
+    context.user_data['search'] = search
+
+    rows, has_more = await run_search(search, 0)
+    text, reply_markup = format_search_results(
+        search['terms'], rows, 0, has_more, update.effective_user.id, thread_id is not None
+    )
+    await reply_to_message(update, context, text, reply_markup=reply_markup)
+
+async def handle_search_callback(update, context):
+    """Show another page of the user's last search"""
+    query = update.callback_query
+    _, _, page, button_user_id = query.data.split('_')
+
+    if query.from_user.id != int(button_user_id):
+        await query.answer("❌ This button is not for you!", show_alert=True)
+        return
+
+    search = context.user_data.get('search')
+    if not search or search['chat_id'] != update.effective_chat.id:
+        await query.edit_message_text("❌ Search expired. Run /search again.")
+        return
+
+    page = int(page)
+    rows, has_more = await run_search(search, page)
+    text, reply_markup = format_search_results(
+        search['terms'], rows, page, has_more, query.from_user.id, search['thread_id'] is not None
+    )
+    await query.edit_message_text(text, reply_markup=reply_markup)
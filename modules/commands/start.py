@@ -1,11 +1,10 @@
 """
 Start command with daily rewards and topic support
 """
-import sqlite3
 from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from modules.auth.authorization import check_chat_authorization
-from modules.database.models import upsert_user, get_user_data, log_transaction, DATABASE_FILE
+from modules.database import async_db
 from utils.reply_helper import reply_to_message
 
 async def start_command(update, context):
@@ -18,11 +17,9 @@ async def start_command(update, context):
     first_name = update.effective_user.first_name
     last_name = update.effective_user.last_name
     
-    # Upsert user in database
-    upsert_user(user_id, username, first_name, last_name)
-    user_data = get_user_data(user_id)
+    # Loaded once for this update by the pre-dispatch stage, unless its upsert failed
+    user_data = getattr(context, 'user_record', None) or await async_db.get_user_data(user_id)
     
-   
     keyboard = [
         [InlineKeyboardButton("💱 Crypto Convert", callback_data=f'crypto_{user_id}')],
         [InlineKeyboardButton("🎲 Bet Calculator", callback_data=f'bet_{user_id}')],
@@ -35,9 +32,12 @@ async def start_command(update, context):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
+    # Without a stored row there is no balance to show
+    balance_line = f"You have {user_data['degencoins']} degencoins 🪙\n\n" if user_data else "\n"
+    
     await reply_to_message(update, context,
         f"Welcome {first_name or username}! 🤖\n"
-    #    f"You have {user_data['degencoins']} degencoins 🪙\n\n"
+        f"{balance_line}"
         "Choose a feature:",
         reply_markup=reply_markup
     )
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+User and chat statistics from the aggregate stats tables
+"""
+from telegram.helpers import escape_markdown
+from modules.auth.authorization import check_chat_authorization
+from modules.database import async_db
+from modules.database.models import get_user_cache_stats
+from modules.handlers.pre_dispatch import get_pre_dispatch_stats
+from utils.loop_monitor import get_loop_lag_stats
+from utils.reply_helper import reply_to_message
+from utils.send_queue import get_send_queue_stats
+
+async def build_user_stats_text(user_id: int, display_name: str) -> str:
+    """Format one user's stats as Markdown; names are escaped here"""
+    user = await async_db.get_user_data(user_id)
+    stats = await async_db.get_user_stats(user_id)
+
+    messages = stats.messages if stats else 0
+    fights = stats.fights if stats else 0
+    fights_won = stats.fights_won if stats else 0
+    win_rate = f"{fights_won / fights:.0%}" if fights else "-"
+
+    return (
+        f"📊 **Stats for {escape_markdown(display_name)}**\n\n"
+        f"💰 Balance: {user['degencoins'] if user else 0} degencoins\n"
+        f"💬 Messages: {messages:,}\n"
+        f"⚔️ Fights: {fights} (won {fights_won}, {win_rate})\n"
+        f"🏆 Prize money won: {stats.coins_won if stats else 0:,}\n"
+        f"💸 Stakes lost: {stats.coins_lost if stats else 0:,}\n"
+        f"🎨 Images generated: {user['images_generated'] if user else 0}"
+    )
+
+async def build_chat_stats_text(chat_id: int, chat_title: str) -> str:
+    """Format one chat's stats and most active members as Markdown; names are escaped here"""
+    stats, top_members = await async_db.get_chat_stats(chat_id)
+    if not stats:
+        return "📊 No activity recorded for this chat yet."
+
+    text = (
+        f"📊 **Stats for {escape_markdown(chat_title)}**\n\n"
+        f"💬 Messages: {stats.messages:,}\n"
+        f"👥 Members seen: {stats.members:,}\n"
+        f"⚔️ Fights: {stats.fights} ({stats.coins_wagered:,} coins wagered)\n"
+    )
+    if top_members:
+        text += "\n🗣 **Most active:**\n"
+        for rank, (first_name, username, message_count) in enumerate(top_members, 1):
+            name = first_name or (f"@{username}" if username else "Unknown")
+            text += f"{rank}. {escape_markdown(name)}: {message_count:,}\n"
+    return text
+
+def build_bot_stats_text() -> str:
+    """Format the bot's runtime health counters"""
+    loop = get_loop_lag_stats()
+    cache = get_user_cache_stats()
+    dispatch = get_pre_dispatch_stats()
+    sends = get_send_queue_stats()
+    return (
+        f"🩺 **Bot health**\n\n"
+        f"⏱ Loop lag: avg {loop['avg_ms']:.1f} ms, max {loop['max_ms']:.0f} ms, {loop['stalls']} stalls\n"
+        f"🗄 DB queue: {async_db.get_queue_depth()} in flight\n"
+        f"👤 User cache: {cache['size']:,}/{cache['max_size']:,}, {cache['hit_rate']:.0%} hits, "
+        f"{cache['evictions']:,} evictions\n"
+        f"🚦 Pre-dispatch: {dispatch['updates']:,} updates, avg {dispatch['avg_ms']:.1f} ms, "
+        f"max {dispatch['max_ms']:.0f} ms, {dispatch['slow']} slow\n"
+        f"📤 Send queue: {sum(sends['queued'])} queued, {sends['in_flight']} in flight, {sends['sent']:,} sent, "
+        f"{sends['failed']} failed, {sends['retries']} retries, {sends['coalesced']} coalesced, "
+        f"max delay {sends['max_delay_ms']:.0f} ms"
+    )
+
+async def stats_command(update, context):
+    """Show your stats, this chat's with /stats chat, or the bot's health with /stats bot (admin only)"""
+    if not await check_chat_authorization(update, context):
+        return
+
+    user = update.effective_user
+    chat = update.effective_chat
+    scope = context.args[0].lower() if context.args else None
+    if scope == 'bot' and user.id == context.bot_data.get('admin_user_id'):
+        text = build_bot_stats_text()
+    elif scope == 'chat':
+        if chat.type == 'private':
+            await reply_to_message(update, context, "❌ `/stats chat` only works in groups.", parse_mode='Markdown')
+            return
+        text = await build_chat_stats_text(chat.id, chat.title or str(chat.id))
+    else:
+        text = await build_user_stats_text(user.id, user.first_name or user.username or "you")
+
+    await reply_to_message(update, context, text, parse_mode='Markdown')
@@ -7,9 +7,8 @@ import openai
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ConversationHandler
 from modules.auth.authorization import check_chat_authorization
-from modules.database.models import update_user_timezone, get_all_user_timezones, get_chat_user_timezones, get_user_data
+from modules.database import async_db
 from utils.reply_helper import reply_to_message
-from utils.user_helper import ensure_user_in_database
 from config.logging_config import logger
 
 # Common country/city to timezone mapping
@@ -42,11 +41,8 @@ async def set_timezone(update, context):
     if not await check_chat_authorization(update, context):
         return ConversationHandler.END
 
-    # Ensure user exists in database
-    ensure_user_in_database(update)
-
     user_id = update.effective_user.id
-    user_data = get_user_data(user_id)
+    user_data = await async_db.get_user_data(user_id)
     
     # Check if user already has a timezone set
     if user_data and user_data.get('timezone'):
@@ -76,14 +72,15 @@ async def set_timezone(update, context):
     return TIMEZONE_INPUT
 
 async def show_times(update, context):
-    """Show current times for all users"""
+    """Show current times for members of this chat, or all users in private"""
     if not await check_chat_authorization(update, context):
         return
     
-    # Ensure user exists in database
-    ensure_user_in_database(update)
-    
-    user_timezones = get_all_user_timezones()
+    chat = update.effective_chat
+    if chat.type == 'private':
+        user_timezones = await async_db.get_all_user_timezones()
+    else:
+        user_timezones = await async_db.get_chat_user_timezones(chat.id)
     
     if not user_timezones:
         await reply_to_message(update, context, "❌ No users have set their timezone yet.")
@@ -113,7 +110,7 @@ async def show_times(update, context):
                     tz = pytz.timezone(fixed_timezone)
                     current_time = datetime.now(tz).strftime("%H:%M %Z")
                     # Update database with fixed timezone
-                    update_user_timezone(user_id, fixed_timezone)
+                    await async_db.update_user_timezone(user_id, fixed_timezone)
                     message += f"• {display_name}: {current_time} ({fixed_timezone}) ✅ Auto-fixed\n"
                     logger.info(f"Fixed timezone for user {user_id}: {timezone_str} -> {fixed_timezone}")
                 except Exception:
@@ -219,7 +216,7 @@ async def timezone_confirm(update, context):
     
     # Handle existing timezone options
     if text == '✅ Keep Current':
-        user_data = get_user_data(user_id)
+        user_data = await async_db.get_user_data(user_id)
         if user_data and user_data.get('timezone'):
             tz_str = user_data['timezone']
             try:
@@ -255,7 +252,7 @@ async def timezone_confirm(update, context):
         try:
             # Double-check timezone is valid before saving
             tz = pytz.timezone(tz_str)
-            update_user_timezone(user_id, tz_str)
+            await async_db.update_user_timezone(user_id, tz_str)
             current_time = datetime.now(tz).strftime('%H:%M %Z')
             
             await reply_to_message(update, context,
@@ -280,7 +277,7 @@ async def timezone_confirm(update, context):
         if text.lower() in ('yes', 'y'):
             tz_str = context.user_data.get('tz_suggestion') or context.user_data.get('suggested_timezone')
             if tz_str:
-                update_user_timezone(user_id, tz_str)
+                await async_db.update_user_timezone(user_id, tz_str)
                 tz = pytz.timezone(tz_str)
                 current_time = datetime.now(tz).strftime('%H:%M %Z')
                 await reply_to_message(update, context,
@@ -0,0 +1,149 @@
+"""
+Monthly archival of old chat history into cold storage databases
+"""
+import glob
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from config.settings import CHAT_HISTORY_RETENTION_DAYS, CHAT_HISTORY_ARCHIVE_DIR
+from modules.database.connection import BACKEND, get_connection, get_db
+from config.logging_config import logger
+
+# Rows moved per transaction so the hot database is never locked for long
+ARCHIVE_BATCH_SIZE = 5000
+
+# How often the rollover job runs, in seconds
+ARCHIVE_INTERVAL = 6 * 60 * 60
+
+CHAT_HISTORY_COLUMNS = (
+    'id, message_id, user_id, username, first_name, last_name, chat_id, chat_title, chat_type, '
+    'message_text, message_type, media_file_id, media_file_path, reply_to_message_id, '
+    'forward_from_user_id, edit_date, message_thread_id, timestamp'
+)
+
+def get_archive_path(month: str) -> str:
+    """Path of the archive database for a YYYY_MM month"""
+    return os.path.join(CHAT_HISTORY_ARCHIVE_DIR, f'chat_history_{month}.db')
+
+def list_archive_paths() -> list:
+    """All monthly archive databases, oldest first"""
+    return sorted(glob.glob(os.path.join(CHAT_HISTORY_ARCHIVE_DIR, 'chat_history_*.db')))
+
+def _create_archive_schema(conn, schema: str):
+    """Create the archive table and its indexes if missing"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.chat_history (
+            id INTEGER PRIMARY KEY,
+            message_id INTEGER,
+            user_id INTEGER,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            chat_id INTEGER,
+            chat_title TEXT,
+            chat_type TEXT,
+            message_text TEXT,
+            message_type TEXT,
+            media_file_id TEXT,
+            media_file_path TEXT,
+            reply_to_message_id INTEGER,
+            forward_from_user_id INTEGER,
+            edit_date INTEGER,
+            message_thread_id INTEGER,
+            timestamp TIMESTAMP
+        )
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_archive_chat_user ON chat_history(chat_id, user_id)')
+
+def archive_old_chat_history(max_age_days: int = CHAT_HISTORY_RETENTION_DAYS) -> int:
+    """
+    Move chat history older than max_age_days into per-month archive databases.
+    Returns the number of rows moved.
+    """
+    if BACKEND == 'postgres':
+        # Archives are SQLite files; PostgreSQL keeps all history in place
+        return 0
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+    conn = get_connection()
+
+    with get_db():
+        months = [row[0] for row in conn.execute(
+            "SELECT DISTINCT strftime('%Y_%m', timestamp) FROM chat_history WHERE timestamp < ?", (cutoff,)
+        )]
+    if not months:
+        return 0
+
+    os.makedirs(CHAT_HISTORY_ARCHIVE_DIR, exist_ok=True)
+    moved = 0
+    for month in months:
+        month_start = datetime.strptime(month, '%Y_%m')
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        upper = min(cutoff, next_month.strftime('%Y-%m-%d %H:%M:%S'))
+        lower = month_start.strftime('%Y-%m-%d %H:%M:%S')
+
+        # ATTACH is not allowed inside a transaction
+        conn.execute('ATTACH DATABASE ? AS archive', (get_archive_path(month),))
+        try:
+            with get_db():
+                _create_archive_schema(conn, 'archive')
+            while True:
+                with get_db():
+                    ids = [row[0] for row in conn.execute(
+                        'SELECT id FROM main.chat_history WHERE timestamp >= ? AND timestamp < ? LIMIT ?',
+                        (lower, upper, ARCHIVE_BATCH_SIZE)
+                    )]
+                    if not ids:
+                        break
+                    placeholders = ','.join('?' * len(ids))
+                    conn.execute(
+                        f'INSERT OR IGNORE INTO archive.chat_history ({CHAT_HISTORY_COLUMNS}) '
+                        f'SELECT {CHAT_HISTORY_COLUMNS} FROM main.chat_history WHERE id IN ({placeholders})',
+                        ids
+                    )
+                    # Attached files commit separately; INSERT OR IGNORE makes a retry after a crash safe
+                    conn.execute(f'DELETE FROM main.chat_history WHERE id IN ({placeholders})', ids)
+                moved += len(ids)
+        finally:
+            conn.execute('DETACH DATABASE archive')
+
+    logger.info(f"Archived {moved} chat history rows older than {max_age_days} days")
+    return moved
+
+def get_archived_chat_members() -> list:
+    """
+    Per-chat speaker activity found in the archive databases.
+    Returns (chat_id, user_id, first_seen, last_seen, message_count) rows.
+    """
+    members = []
+    for path in list_archive_paths():
+        archive_conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            members.extend(archive_conn.execute('''
+                SELECT chat_id, user_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+                FROM chat_history WHERE user_id IS NOT NULL
+                GROUP BY chat_id, user_id
+            ''').fetchall())
+        finally:
+            archive_conn.close()
+    return members
+
+def iter_archived_chat_history(chat_id: int, columns: tuple, batch_size: int):
+    """
+    Yield one chat's archived rows in id order, oldest archive first, batch_size at a time.
+    Each batch is its own short read, so the rollover job never waits on an export.
+    """
+    for path in list_archive_paths():
+        archive_conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            after_id = 0
+            while True:
+                rows = archive_conn.execute(
+                    f"SELECT {', '.join(columns)} FROM chat_history WHERE id > ? AND chat_id = ? ORDER BY id LIMIT ?",
+                    (after_id, chat_id, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                yield rows
+                after_id = rows[-1][0]
+        finally:
+            archive_conn.close()
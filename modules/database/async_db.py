@@ -0,0 +1,103 @@
+"""
+Async data access running on a dedicated database thread
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import POSTGRES_POOL_SIZE
+from modules.database import models, archive, export
+from modules.database.connection import BACKEND
+from modules.economy import ledger
+
+# Maximum database calls in flight before callers wait for a slot
+DB_QUEUE_SIZE = 256
+
+# SQLite has a single writer, so one worker keeps one long-lived connection and serializes writes;
+# PostgreSQL gets a worker per pooled connection
+DB_WORKERS = POSTGRES_POOL_SIZE if BACKEND == 'postgres' else 1
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+_queue_slots = None
+_pending = 0
+
+async def run_in_db(func, *args, **kwargs):
+    """Run a blocking database function on the database thread"""
+    global _queue_slots, _pending
+    if _queue_slots is None:
+        _queue_slots = asyncio.Semaphore(DB_QUEUE_SIZE)
+
+    _pending += 1
+    try:
+        async with _queue_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        _pending -= 1
+
+def get_queue_depth() -> int:
+    """Number of database calls waiting or running"""
+    return _pending
+
+def shutdown_db_thread():
+    """Wait for queued database work and stop the database thread"""
+    _executor.shutdown(wait=True)
+
+async def run_in_reader(func, *args, **kwargs):
+    """Run a long, mostly read-only job on its own thread so it does not hold up the database thread"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+def _async(func):
+    """Expose a blocking models function as a coroutine"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db(func, *args, **kwargs)
+    return wrapper
+
+# Users
+get_user_data = _async(models.get_user_data)
+get_balance = _async(models.get_balance)
+get_user_by_username = _async(models.get_user_by_username)
+upsert_user = _async(models.upsert_user)
+ensure_user = _async(models.ensure_user)
+update_user_degencoins = _async(models.update_user_degencoins)
+update_user_timezone = _async(models.update_user_timezone)
+get_all_user_timezones = _async(models.get_all_user_timezones)
+get_chat_user_timezones = _async(models.get_chat_user_timezones)
+get_user_stats = _async(models.get_user_stats)
+get_chat_stats = _async(models.get_chat_stats)
+
+# Chats
+load_authorized_chats = _async(models.load_authorized_chats)
+add_authorized_chat = _async(models.add_authorized_chat)
+revoke_authorized_chat = _async(models.revoke_authorized_chat)
+save_access_request = _async(models.save_access_request)
+update_access_request_status = _async(models.update_access_request_status)
+get_access_request = _async(models.get_access_request)
+
+# History
+insert_chat_history_batch = _async(models.insert_chat_history_batch)
+archive_old_chat_history = _async(archive.archive_old_chat_history)
+search_chat_history = _async(models.search_chat_history)
+
+async def export_analytics():
+    """Incremental Parquet export, run beside the database thread"""
+    return await run_in_reader(export.export_analytics)
+
+# Transactions
+log_transaction = _async(models.log_transaction)
+credit = _async(ledger.credit)
+debit = _async(ledger.debit)
+transfer = _async(ledger.transfer)
+settle = _async(ledger.settle)
+get_user_transactions = _async(models.get_user_transactions)
+
+# Fights
+save_fight_history = _async(models.save_fight_history)
+get_recent_fights = _async(models.get_recent_fights)
+
+# Images and counters
+reserve_draw_quota = _async(models.reserve_draw_quota)
+release_draw_quota = _async(models.release_draw_quota)
+purge_draw_history = _async(models.purge_draw_history)
+log_draw_request = _async(models.log_draw_request)
+increment_cunt_counter = _async(models.increment_cunt_counter)
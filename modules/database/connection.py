@@ -0,0 +1,117 @@
+"""
+Shared database connection management
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config.settings import DATABASE_URL
+from modules.database import postgres
+
+DATABASE_FILE = 'bot_database.db'
+
+# PostgreSQL when DATABASE_URL points at a server, otherwise the local SQLite file
+BACKEND = 'postgres' if DATABASE_URL and DATABASE_URL.startswith(('postgres://', 'postgresql://')) else 'sqlite'
+
+# Number of prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Applied once to every new connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',   # fsync on checkpoint instead of every commit
+    'PRAGMA mmap_size = 268435456',  # 256 MB memory-mapped reads
+    'PRAGMA cache_size = -65536',    # 64 MB page cache
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+# One long-lived connection per thread
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+def _open_connection() -> sqlite3.Connection:
+    """Open a new connection with tuned pragmas"""
+    conn = sqlite3.connect(
+        DATABASE_FILE,
+        timeout=5.0,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False
+    )
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """Get the long-lived SQLite connection for the current thread"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.generation != _generation:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.depth = 0
+        _local.generation = _generation
+    return conn
+
+@contextmanager
+def get_db():
+    """
+    Yield the shared connection inside a transaction.
+    Commits on success and rolls back on error; nested blocks join the outer transaction.
+    On PostgreSQL a pooled connection is borrowed for the outermost block only.
+    """
+    if BACKEND == 'postgres':
+        conn = getattr(_local, 'pg_conn', None)
+        if conn is None:
+            conn = _local.pg_conn = postgres.acquire()
+            _local.depth = 0
+    else:
+        conn = get_connection()
+    depth = _local.depth
+    _local.depth = depth + 1
+    if depth == 0:
+        _local.after_commit = []
+    try:
+        yield conn
+        if depth == 0:
+            conn.commit()
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth = depth
+        if depth == 0:
+            # Only reached below on commit; a rollback discards them
+            callbacks, _local.after_commit = _local.after_commit, []
+            if BACKEND == 'postgres':
+                _local.pg_conn = None
+                postgres.release(conn)
+    if depth == 0:
+        for callback in callbacks:
+            callback()
+
+def after_commit(callback):
+    """
+    Run callback once the current transaction commits, or now if none is open.
+    Dropped if the transaction rolls back, so caches never show uncommitted writes.
+    """
+    if getattr(_local, 'depth', 0):
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+def close_all_connections():
+    """Close every connection opened by this process"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+    postgres.close_pool()
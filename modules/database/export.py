@@ -0,0 +1,149 @@
+"""
+Incremental Parquet export of chat history and transactions for analytics
+"""
+import csv
+import gzip
+import importlib.util
+import io
+import itertools
+import os
+from collections import defaultdict
+from config.settings import ANALYTICS_EXPORT_DIR
+from modules.database.archive import iter_archived_chat_history
+from modules.database.connection import get_db
+from config.logging_config import logger
+
+# Rows read per query; bounds memory for both the Parquet and CSV exports
+EXPORT_BATCH_SIZE = 10000
+
+# How often the Parquet export runs, in seconds
+EXPORT_INTERVAL = 24 * 60 * 60
+
+CHAT_HISTORY_EXPORT_COLUMNS = (
+    'id', 'message_id', 'user_id', 'username', 'first_name', 'last_name', 'chat_id', 'chat_title',
+    'chat_type', 'message_text', 'message_type', 'media_file_id', 'reply_to_message_id',
+    'forward_from_user_id', 'edit_date', 'message_thread_id', 'timestamp'
+)
+TRANSACTION_EXPORT_COLUMNS = (
+    'id', 'from_user_id', 'to_user_id', 'amount', 'transaction_type', 'description', 'timestamp'
+)
+
+# Arrow types of exported columns; anything not listed is a string
+EXPORT_COLUMN_TYPES = {
+    'id': 'int64', 'message_id': 'int64', 'user_id': 'int64', 'chat_id': 'int64',
+    'reply_to_message_id': 'int64', 'forward_from_user_id': 'int64', 'message_thread_id': 'int64',
+    'edit_date': 'double', 'from_user_id': 'int64', 'to_user_id': 'int64', 'amount': 'int64',
+}
+
+# table -> (columns, partition key columns, function giving the Hive partition path of a row);
+# key columns live in the path only, as Hive-style readers expect
+EXPORT_TABLES = {
+    'chat_history': (
+        CHAT_HISTORY_EXPORT_COLUMNS,
+        ('chat_id',),
+        lambda row: f"chat_id={row[6]}/date={str(row[-1])[:10]}"
+    ),
+    'transactions': (
+        TRANSACTION_EXPORT_COLUMNS,
+        (),
+        lambda row: f"date={str(row[-1])[:10]}"
+    ),
+}
+
+def parquet_available() -> bool:
+    """Whether pyarrow is installed"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+def iter_batches(table: str, columns: tuple, after_id: int = 0, where: str = '', params: tuple = ()):
+    """
+    Yield rows in id order, EXPORT_BATCH_SIZE at a time.
+    Each batch is its own short read so a long export never holds a snapshot open.
+    """
+    condition = f'id > ? AND {where}' if where else 'id > ?'
+    while True:
+        with get_db() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {condition} ORDER BY id LIMIT ?",
+                (after_id, *params, EXPORT_BATCH_SIZE)
+            ).fetchall()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+def get_export_position(table: str) -> int:
+    """Last id already exported from a table"""
+    with get_db() as conn:
+        row = conn.execute('SELECT last_id FROM export_state WHERE table_name = ?', (table,)).fetchone()
+    return row[0] if row else 0
+
+def _set_export_position(table: str, last_id: int):
+    """Record the last id written to Parquet"""
+    with get_db() as conn:
+        conn.execute('''
+            INSERT INTO export_state (table_name, last_id) VALUES (?, ?)
+            ON CONFLICT(table_name) DO UPDATE SET last_id = excluded.last_id
+        ''', (table, last_id))
+
+def _write_parquet_batch(table: str, rows: list) -> int:
+    """Write one batch as a part file in each partition it touches; returns files written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns, partition_keys, partition_of = EXPORT_TABLES[table]
+    kept = [(index, name) for index, name in enumerate(columns) if name not in partition_keys]
+    schema = pa.schema([(name, pa.type_for_alias(EXPORT_COLUMN_TYPES.get(name, 'string'))) for _, name in kept])
+
+    partitions = defaultdict(list)
+    for row in rows:
+        partitions[partition_of(row)].append(row)
+
+    # Named after the batch's first id, so a batch retried after a crash overwrites its own files
+    part_name = f'part-{rows[0][0]:012d}.parquet'
+    for partition, partition_rows in partitions.items():
+        directory = os.path.join(ANALYTICS_EXPORT_DIR, table, partition)
+        os.makedirs(directory, exist_ok=True)
+        # Timestamps are text on SQLite and datetimes on PostgreSQL; export both as text
+        arrays = [
+            [str(row[index]) if name == 'timestamp' and row[index] is not None else row[index]
+             for row in partition_rows]
+            for index, name in kept
+        ]
+        pq.write_table(pa.Table.from_arrays(arrays, schema=schema), os.path.join(directory, part_name))
+    return len(partitions)
+
+def export_table(table: str) -> int:
+    """Export rows added since the last run to partitioned Parquet files; returns rows exported"""
+    columns = EXPORT_TABLES[table][0]
+    exported = 0
+    files = 0
+    for rows in iter_batches(table, columns, get_export_position(table)):
+        files += _write_parquet_batch(table, rows)
+        _set_export_position(table, rows[-1][0])
+        exported += len(rows)
+    if exported:
+        logger.info(f"Exported {exported} {table} rows to {files} Parquet files")
+    return exported
+
+def export_analytics() -> dict:
+    """Run the incremental export for every analytics table"""
+    return {table: export_table(table) for table in EXPORT_TABLES}
+
+def write_chat_history_csv(chat_id: int, out) -> int:
+    """Write one chat's history, archives included, as gzipped CSV to a binary file object; returns rows written"""
+    written = 0
+    with gzip.GzipFile(fileobj=out, mode='wb') as compressed:
+        text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(CHAT_HISTORY_EXPORT_COLUMNS)
+        # Archived months first, then the hot table, so the file stays in id order
+        batches = itertools.chain(
+            iter_archived_chat_history(chat_id, CHAT_HISTORY_EXPORT_COLUMNS, EXPORT_BATCH_SIZE),
+            iter_batches('chat_history', CHAT_HISTORY_EXPORT_COLUMNS, where='chat_id = ?', params=(chat_id,))
+        )
+        for rows in batches:
+            writer.writerows(rows)
+            written += len(rows)
+        text.flush()
+        text.detach()
+    return written
@@ -0,0 +1,45 @@
+"""
+Write-behind buffer for chat history auditing
+"""
+import asyncio
+from modules.database import async_db
+from config.logging_config import logger
+
+# Flush when this many rows are buffered or this much time has passed
+HISTORY_FLUSH_ROWS = 200
+HISTORY_FLUSH_INTERVAL_MS = 500
+
+# Rows kept for retry after a failed flush before the oldest are dropped
+HISTORY_MAX_PENDING_ROWS = 10000
+
+class ChatHistoryBuffer:
+    """Collects chat history rows in memory and writes them in batches"""
+
+    def __init__(self, flush_rows: int = HISTORY_FLUSH_ROWS):
+        self.flush_rows = flush_rows
+        self._rows = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    async def add(self, row: tuple):
+        """Queue a row, flushing immediately once the batch is full"""
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows:
+            await self.flush()
+
+    async def flush(self):
+        """Write all buffered rows with a single executemany"""
+        if not self._rows:
+            return
+
+        rows, self._rows = self._rows, []
+        try:
+            # Shielded so a cancelled flush job cannot drop a batch halfway
+            await asyncio.shield(async_db.insert_chat_history_batch(rows))
+        except Exception as e:
+            logger.error(f"Failed to flush {len(rows)} chat history rows: {e}")
+            # Keep the rows for the next flush, newest messages win if we fall too far behind
+            self._rows = (rows + self._rows)[-HISTORY_MAX_PENDING_ROWS:]
+
+chat_history_buffer = ChatHistoryBuffer()
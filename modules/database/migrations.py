@@ -0,0 +1,602 @@
+"""
+Versioned schema migrations
+"""
+from datetime import datetime, timedelta
+from modules.database.connection import BACKEND, get_connection, get_db
+from modules.database.archive import get_archived_chat_members
+from config.logging_config import logger
+
+def _baseline_schema(cursor):
+    """Tables, indexes and triggers as they existed before versioning"""
+    
+    # Users table with enhanced fields
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            timezone TEXT,
+            degencoins INTEGER DEFAULT 1000,
+            daily_streak INTEGER DEFAULT 0,
+            last_daily_claim TEXT,
+            total_fights INTEGER DEFAULT 0,
+            fights_won INTEGER DEFAULT 0,
+            total_tips_sent INTEGER DEFAULT 0,
+            total_tips_received INTEGER DEFAULT 0,
+            achievements TEXT DEFAULT '[]',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Authorized chats table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS authorized_chats (
+            chat_id INTEGER PRIMARY KEY,
+            chat_title TEXT,
+            chat_type TEXT,
+            approved_by INTEGER,
+            approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active INTEGER DEFAULT 1
+        )
+    ''')
+    
+    # Chat access requests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_access_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            chat_title TEXT,
+            chat_type TEXT,
+            requested_by INTEGER,
+            requested_by_username TEXT,
+            request_message TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            processed_by INTEGER
+        )
+    ''')
+    
+    # Enhanced chat history table with full auditing
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER,
+            user_id INTEGER,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            chat_id INTEGER,
+            chat_title TEXT,
+            chat_type TEXT,
+            message_text TEXT,
+            message_type TEXT,
+            media_file_id TEXT,
+            media_file_path TEXT,
+            reply_to_message_id INTEGER,
+            forward_from_user_id INTEGER,
+            edit_date INTEGER,
+            message_thread_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Fight history table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fight_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fight_type TEXT,
+            chat_id INTEGER,
+            participants TEXT,
+            winner_id INTEGER,
+            winner_name TEXT,
+            bet_amount INTEGER,
+            total_pot INTEGER,
+            turns_taken INTEGER,
+            fight_scenario TEXT,
+            fight_log TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (winner_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Transaction history table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER,
+            to_user_id INTEGER,
+            amount INTEGER,
+            transaction_type TEXT,
+            description TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Images table for image handlers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # User images table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_images (
+            user_id INTEGER,
+            image_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (image_id) REFERENCES images (id),
+            PRIMARY KEY (user_id, image_id)
+        )
+    ''')
+    
+    # Group images table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS group_images (
+            channel_id INTEGER,
+            image_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (image_id) REFERENCES images (id),
+            PRIMARY KEY (channel_id, image_id)
+        )
+    ''')
+    
+    # Draw requests table for rate limiting
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draw_requests (
+            user_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Cunt counter table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cunt_counter (
+            chat_id INTEGER PRIMARY KEY,
+            count INTEGER DEFAULT 0
+        )
+    ''')
+    
+    # Who has spoken in which chat, maintained by the history ingestion path
+    members_exist = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_members'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id INTEGER,
+            user_id INTEGER,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            message_count INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    if not members_exist:
+        _backfill_chat_members(cursor)
+    
+    # Create indexes for better performance
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_chat_id ON chat_history(chat_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_thread_id ON chat_history(message_thread_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_from_user ON transactions(from_user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_to_user ON transactions(to_user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(lower(username))')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_first_name_lower ON users(lower(first_name))')
+    
+    # Balances can never go negative, whichever code path writes them
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_degencoins_non_negative
+        BEFORE UPDATE OF degencoins ON users
+        WHEN NEW.degencoins < 0
+        BEGIN
+            SELECT RAISE(ABORT, 'degencoins cannot be negative');
+        END
+    ''')
+    
+    # Full-text index over message text, kept in sync with chat_history by triggers
+    fts_exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+            message_text, content='chat_history', content_rowid='id'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_history_fts_insert AFTER INSERT ON chat_history
+        WHEN NEW.message_text IS NOT NULL
+        BEGIN
+            INSERT INTO chat_history_fts (rowid, message_text) VALUES (NEW.id, NEW.message_text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_history_fts_delete AFTER DELETE ON chat_history
+        WHEN OLD.message_text IS NOT NULL
+        BEGIN
+            INSERT INTO chat_history_fts (chat_history_fts, rowid, message_text) VALUES ('delete', OLD.id, OLD.message_text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_history_fts_update AFTER UPDATE OF message_text ON chat_history
+        BEGIN
+            INSERT INTO chat_history_fts (chat_history_fts, rowid, message_text)
+            SELECT 'delete', OLD.id, OLD.message_text WHERE OLD.message_text IS NOT NULL;
+            INSERT INTO chat_history_fts (rowid, message_text)
+            SELECT NEW.id, NEW.message_text WHERE NEW.message_text IS NOT NULL;
+        END
+    ''')
+    if not fts_exists:
+        # Index history that was written before the FTS table existed
+        cursor.execute("INSERT INTO chat_history_fts (chat_history_fts) VALUES ('rebuild')")
+
+def _backfill_chat_members(cursor):
+    """Build chat_members from existing hot and archived history"""
+    cursor.execute('''
+        INSERT INTO chat_members (chat_id, user_id, first_seen, last_seen, message_count)
+        SELECT chat_id, user_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+        FROM chat_history WHERE user_id IS NOT NULL
+        GROUP BY chat_id, user_id
+    ''')
+    cursor.executemany('''
+        INSERT INTO chat_members (chat_id, user_id, first_seen, last_seen, message_count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(chat_id, user_id) DO UPDATE SET
+            first_seen = MIN(first_seen, excluded.first_seen),
+            last_seen = MAX(last_seen, excluded.last_seen),
+            message_count = message_count + excluded.message_count
+    ''', get_archived_chat_members())
+
+def _add_images_generated(cursor):
+    """Per-user image counter used by the artist achievement"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(users)')]
+    if 'images_generated' not in columns:
+        cursor.execute('ALTER TABLE users ADD COLUMN images_generated INTEGER DEFAULT 0')
+    # Seed from the draw log so existing artists keep their progress
+    cursor.execute('''
+        UPDATE users SET images_generated = (
+            SELECT COUNT(*) FROM draw_requests WHERE draw_requests.user_id = users.user_id
+        )
+        WHERE user_id IN (SELECT user_id FROM draw_requests)
+    ''')
+
+def _add_draw_quota(cursor):
+    """Per-user daily image counters and an index for purging the draw log"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draw_quota (
+            user_id INTEGER,
+            day TEXT,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_draw_requests_timestamp ON draw_requests(timestamp)')
+    # Carry over today's usage so nobody gets a fresh quota from the deploy. The draw log and
+    # reserve_draw_quota both use local time, while SQLite's 'now' is UTC, so the cutoff comes from Python.
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor.execute('''
+        INSERT OR IGNORE INTO draw_quota (user_id, day, count)
+        SELECT user_id, date(timestamp), COUNT(*) FROM draw_requests
+        WHERE timestamp >= ?
+        GROUP BY user_id, date(timestamp)
+    ''', (yesterday,))
+
+def _add_export_state(cursor):
+    """Last exported id per table for the incremental analytics export"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS export_state (
+            table_name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+def _create_stats_tables(cursor):
+    """Aggregate tables shared by both backends"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            fights INTEGER NOT NULL DEFAULT 0,
+            fights_won INTEGER NOT NULL DEFAULT 0,
+            coins_won INTEGER NOT NULL DEFAULT 0,
+            coins_lost INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_stats (
+            chat_id BIGINT PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            members INTEGER NOT NULL DEFAULT 0,
+            fights INTEGER NOT NULL DEFAULT 0,
+            coins_wagered INTEGER NOT NULL DEFAULT 0,
+            last_message_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_members_activity ON chat_members(chat_id, message_count)')
+    # Message and membership totals come straight from chat_members, which already covers archived history
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, messages)
+        SELECT user_id, SUM(message_count) FROM chat_members GROUP BY user_id
+    ''')
+    cursor.execute('''
+        INSERT INTO chat_stats (chat_id, messages, members, last_message_at)
+        SELECT chat_id, SUM(message_count), COUNT(*), MAX(last_seen) FROM chat_members GROUP BY chat_id
+    ''')
+    cursor.execute('''
+        INSERT INTO chat_stats (chat_id, fights, coins_wagered)
+        SELECT chat_id, COUNT(*), SUM(total_pot) FROM fight_history GROUP BY chat_id
+        ON CONFLICT(chat_id) DO UPDATE SET
+            fights = excluded.fights,
+            coins_wagered = excluded.coins_wagered
+    ''')
+
+def _add_stats(cursor):
+    """Per-user and per-chat statistics maintained at write time"""
+    _create_stats_tables(cursor)
+    # Earlier fights did not record stakes, so only counts and prizes can be rebuilt
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, fights, fights_won, coins_won)
+        SELECT json_extract(p.value, '$.user_id') AS user_id, COUNT(*),
+               SUM(json_extract(p.value, '$.user_id') = f.winner_id),
+               SUM(CASE WHEN json_extract(p.value, '$.user_id') = f.winner_id THEN f.total_pot ELSE 0 END)
+        FROM fight_history f, json_each(f.participants) p
+        GROUP BY user_id
+        ON CONFLICT(user_id) DO UPDATE SET
+            fights = excluded.fights,
+            fights_won = excluded.fights_won,
+            coins_won = excluded.coins_won
+    ''')
+
+# Numbered migrations, applied in order; never edit one that has shipped, append a new one
+MIGRATIONS = [
+    (1, _baseline_schema),
+    (2, _add_images_generated),
+    (3, _add_draw_quota),
+    (4, _add_export_state),
+    (5, _add_stats),
+]
+
+def _pg_baseline_schema(cursor):
+    """PostgreSQL equivalent of the SQLite schema at version 1"""
+    statements = [
+        '''CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            timezone TEXT,
+            degencoins INTEGER DEFAULT 1000 CHECK (degencoins >= 0),
+            daily_streak INTEGER DEFAULT 0,
+            last_daily_claim TEXT,
+            total_fights INTEGER DEFAULT 0,
+            fights_won INTEGER DEFAULT 0,
+            total_tips_sent INTEGER DEFAULT 0,
+            total_tips_received INTEGER DEFAULT 0,
+            achievements TEXT DEFAULT '[]',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS authorized_chats (
+            chat_id BIGINT PRIMARY KEY,
+            chat_title TEXT,
+            chat_type TEXT,
+            approved_by BIGINT,
+            approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active INTEGER DEFAULT 1
+        )''',
+        '''CREATE TABLE IF NOT EXISTS chat_access_requests (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT,
+            chat_title TEXT,
+            chat_type TEXT,
+            requested_by BIGINT,
+            requested_by_username TEXT,
+            request_message TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            processed_by BIGINT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS chat_history (
+            id BIGSERIAL PRIMARY KEY,
+            message_id BIGINT,
+            user_id BIGINT,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            chat_id BIGINT,
+            chat_title TEXT,
+            chat_type TEXT,
+            message_text TEXT,
+            message_type TEXT,
+            media_file_id TEXT,
+            media_file_path TEXT,
+            reply_to_message_id BIGINT,
+            forward_from_user_id BIGINT,
+            edit_date DOUBLE PRECISION,
+            message_thread_id BIGINT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS fight_history (
+            id BIGSERIAL PRIMARY KEY,
+            fight_type TEXT,
+            chat_id BIGINT,
+            participants TEXT,
+            winner_id BIGINT,
+            winner_name TEXT,
+            bet_amount INTEGER,
+            total_pot INTEGER,
+            turns_taken INTEGER,
+            fight_scenario TEXT,
+            fight_log TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS transactions (
+            id BIGSERIAL PRIMARY KEY,
+            from_user_id BIGINT,
+            to_user_id BIGINT,
+            amount INTEGER,
+            transaction_type TEXT,
+            description TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS images (
+            id BIGSERIAL PRIMARY KEY,
+            file_path TEXT UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS user_images (
+            user_id BIGINT,
+            image_id BIGINT REFERENCES images (id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, image_id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS group_images (
+            channel_id BIGINT,
+            image_id BIGINT REFERENCES images (id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel_id, image_id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS draw_requests (
+            user_id BIGINT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS cunt_counter (
+            chat_id BIGINT PRIMARY KEY,
+            count INTEGER DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id BIGINT,
+            user_id BIGINT,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            message_count INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chat_history_chat_id ON chat_history(chat_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_chat_history_thread_id ON chat_history(message_thread_id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_from_user ON transactions(from_user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_to_user ON transactions(to_user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(lower(username))',
+        'CREATE INDEX IF NOT EXISTS idx_users_first_name_lower ON users(lower(first_name))',
+        # Full-text search uses an expression index instead of an FTS table
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_fts ON chat_history "
+        "USING GIN (to_tsvector('simple', coalesce(message_text, '')))",
+    ]
+    for statement in statements:
+        cursor.execute(statement)
+
+def _pg_add_images_generated(cursor):
+    """Per-user image counter used by the artist achievement"""
+    cursor.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS images_generated INTEGER DEFAULT 0')
+
+def _pg_add_draw_quota(cursor):
+    """Per-user daily image counters and an index for purging the draw log"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draw_quota (
+            user_id BIGINT,
+            day TEXT,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_draw_requests_timestamp ON draw_requests(timestamp)')
+
+def _pg_add_stats(cursor):
+    """Per-user and per-chat statistics maintained at write time"""
+    _create_stats_tables(cursor)
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, fights, fights_won, coins_won)
+        SELECT (p.value->>'user_id')::BIGINT AS user_id, COUNT(*),
+               COUNT(*) FILTER (WHERE (p.value->>'user_id')::BIGINT = f.winner_id),
+               COALESCE(SUM(f.total_pot) FILTER (WHERE (p.value->>'user_id')::BIGINT = f.winner_id), 0)
+        FROM fight_history f, jsonb_array_elements(f.participants::jsonb) p
+        GROUP BY 1
+        ON CONFLICT(user_id) DO UPDATE SET
+            fights = excluded.fights,
+            fights_won = excluded.fights_won,
+            coins_won = excluded.coins_won
+    ''')
+
+# Same version numbers as MIGRATIONS, so both backends describe the same schema
+POSTGRES_MIGRATIONS = [
+    (1, _pg_baseline_schema),
+    (2, _pg_add_images_generated),
+    (3, _pg_add_draw_quota),
+    (4, _add_export_state),
+    (5, _pg_add_stats),
+]
+
+# Serializes migrations when several workers start at once
+POSTGRES_MIGRATION_LOCK_ID = 7261
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn) -> int:
+    """Schema version recorded in the database"""
+    if BACKEND == 'postgres':
+        conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+        return row[0] or 0
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def _set_schema_version(conn, version: int):
+    """Record the schema version in the same transaction as the migrations"""
+    if BACKEND == 'postgres':
+        conn.execute('DELETE FROM schema_version')
+        conn.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+    else:
+        # user_version is part of the database header, so it commits with the migrations
+        conn.execute(f'PRAGMA user_version = {version}')
+
+def _run_pending(conn, migrations, current: int) -> int:
+    """Apply migrations newer than current and record the new version; returns how many ran"""
+    pending = [(version, migration) for version, migration in migrations if version > current]
+    cursor = conn.cursor()
+    for version, migration in pending:
+        migration(cursor)
+        logger.info(f"Applied schema migration {version}: {migration.__doc__}")
+    if pending:
+        _set_schema_version(conn, SCHEMA_VERSION)
+    return len(pending)
+
+def apply_migrations() -> int:
+    """
+    Bring the schema up to SCHEMA_VERSION.
+    Pending migrations run in one transaction, DDL included, so a failure leaves the schema
+    at its previous version. Returns the number of migrations applied.
+    """
+    if BACKEND == 'postgres':
+        with get_db() as conn:
+            # Lock before touching schema_version, so workers starting together migrate one at a time
+            conn.execute('SELECT pg_advisory_xact_lock(?)', (POSTGRES_MIGRATION_LOCK_ID,))
+            return _run_pending(conn, POSTGRES_MIGRATIONS, get_schema_version(conn))
+
+    conn = get_connection()
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+
+    # sqlite3 autocommits DDL issued outside a transaction it opened itself, so open one by hand
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have migrated while we waited for the write lock
+            applied = _run_pending(conn, MIGRATIONS, get_schema_version(conn))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
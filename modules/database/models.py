@@ -1,300 +1,573 @@
 """
 Database models and initialization
 """
-import sqlite3
 import json
-from typing import Dict, Optional
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional
+from modules.database.connection import BACKEND, DATABASE_FILE, after_commit, get_db
+from modules.database.migrations import apply_migrations
+from modules.database.records import (
+    User, AccessRequest, Transaction, Fight, UserStats, ChatStats, fetch_one, fetch_all
+)
 
-DATABASE_FILE = 'bot_database.db'
+# Bounded LRU cache of user rows keyed by user_id; disabled on PostgreSQL,
+# where other workers write the same rows
+USER_CACHE_SIZE = 5000 if BACKEND == 'sqlite' else 0
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+_user_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# Last profile fields written per user, so unchanged upserts skip the database
+USER_PROFILE_FIELDS = ('username', 'first_name', 'last_name')
+USER_PROFILE_CACHE_SIZE = 50000
+_user_profiles = OrderedDict()
+_user_profiles_lock = threading.Lock()
+
+# Lowercased username / first name -> user_id for opponent lookup
+_username_index = {}
+_first_name_index = {}
+_user_directory_lock = threading.Lock()
+
+# Active authorized chat IDs; every group message and command checks this set
+_authorized_chats = set()
+_authorized_chats_lock = threading.Lock()
+
+# Reload interval for the authorized set, which also picks up changes made by other workers
+AUTHORIZED_CHATS_REFRESH_INTERVAL = 5 * 60
+
+# Draw log entries older than this are purged; quotas only ever need today's row
+DRAW_HISTORY_RETENTION_DAYS = 30
+DRAW_PURGE_INTERVAL = 24 * 60 * 60
 
 def init_database():
     """Initialize SQLite database with all required tables"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    
-    # Users table with enhanced fields
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            timezone TEXT,
-            degencoins INTEGER DEFAULT 1000,
-            daily_streak INTEGER DEFAULT 0,
-            last_daily_claim TEXT,
-            total_fights INTEGER DEFAULT 0,
-            fights_won INTEGER DEFAULT 0,
-            total_tips_sent INTEGER DEFAULT 0,
-            total_tips_received INTEGER DEFAULT 0,
-            achievements TEXT DEFAULT '[]',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Authorized chats table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS authorized_chats (
-            chat_id INTEGER PRIMARY KEY,
-            chat_title TEXT,
-            chat_type TEXT,
-            approved_by INTEGER,
-            approved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active INTEGER DEFAULT 1
-        )
-    ''')
-    
-    # Chat access requests table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_access_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_id INTEGER,
-            chat_title TEXT,
-            chat_type TEXT,
-            requested_by INTEGER,
-            requested_by_username TEXT,
-            request_message TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            processed_at TIMESTAMP,
-            processed_by INTEGER
-        )
-    ''')
-    
-    # Enhanced chat history table with full auditing
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            message_id INTEGER,
-            user_id INTEGER,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            chat_id INTEGER,
-            chat_title TEXT,
-            chat_type TEXT,
-            message_text TEXT,
-            message_type TEXT,
-            media_file_id TEXT,
-            media_file_path TEXT,
-            reply_to_message_id INTEGER,
-            forward_from_user_id INTEGER,
-            edit_date INTEGER,
-            message_thread_id INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Fight history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS fight_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fight_type TEXT,
-            chat_id INTEGER,
-            participants TEXT,
-            winner_id INTEGER,
-            winner_name TEXT,
-            bet_amount INTEGER,
-            total_pot INTEGER,
-            turns_taken INTEGER,
-            fight_scenario TEXT,
-            fight_log TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (winner_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Transaction history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            from_user_id INTEGER,
-            to_user_id INTEGER,
-            amount INTEGER,
-            transaction_type TEXT,
-            description TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Images table for image handlers
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_path TEXT UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # User images table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_images (
-            user_id INTEGER,
-            image_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id),
-            FOREIGN KEY (image_id) REFERENCES images (id),
-            PRIMARY KEY (user_id, image_id)
-        )
-    ''')
+    apply_migrations()
+    load_user_directory()
+    load_authorized_chats()
+
+def _cache_get_user(user_id: int) -> Optional[User]:
+    """Get a copy of a cached user, counting hits and misses"""
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+        if user is None:
+            _user_cache_stats['misses'] += 1
+            return None
+        _user_cache.move_to_end(user_id)
+        _user_cache_stats['hits'] += 1
+        return user.copy()
+
+def _cache_put_user(user: User):
+    """Store a user row, evicting the least recently used entry when full"""
+    if not USER_CACHE_SIZE:
+        return
+    with _user_cache_lock:
+        _user_cache[user.user_id] = user.copy()
+        _user_cache.move_to_end(user.user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+            _user_cache_stats['evictions'] += 1
+
+def update_cached_user(user_id: int, **fields):
+    """Write changed columns through to a cached user, if present, once the write has committed"""
+    def apply():
+        with _user_cache_lock:
+            user = _user_cache.get(user_id)
+            if user is not None:
+                for field, value in fields.items():
+                    setattr(user, field, value)
+                user.updated_at = datetime.now(dt_timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    after_commit(apply)
+
+def invalidate_user_cache(user_id: int = None):
+    """Drop one cached user, or the whole cache when no ID is given"""
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+
+def get_user_cache_stats() -> Dict:
+    """Get user cache size and hit/miss counters"""
+    with _user_cache_lock:
+        lookups = _user_cache_stats['hits'] + _user_cache_stats['misses']
+        return {
+            'size': len(_user_cache),
+            'max_size': USER_CACHE_SIZE,
+            'hit_rate': _user_cache_stats['hits'] / lookups if lookups else 0.0,
+            **_user_cache_stats
+        }
+
+def get_user_data(user_id: int) -> Optional[User]:
+    """Get user data from cache or database"""
+    user = _cache_get_user(user_id)
+    if user is not None:
+        return user
     
-    # Group images table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS group_images (
-            channel_id INTEGER,
-            image_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (image_id) REFERENCES images (id),
-            PRIMARY KEY (channel_id, image_id)
-        )
-    ''')
+    with get_db() as conn:
+        user = fetch_one(conn, User, f'SELECT {User.columns()} FROM users WHERE user_id = ?', (user_id,))
     
-    # Draw requests table for rate limiting
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS draw_requests (
-            user_id INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    if user:
+        # Inside a larger transaction the row may not be committed yet
+        after_commit(lambda: _cache_put_user(user))
+    return user
+
+def get_balance(user_id: int) -> Optional[int]:
+    """Get only a user's degencoin balance"""
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+        if user is not None:
+            return user.degencoins
     
-    # Cunt counter table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cunt_counter (
-            chat_id INTEGER PRIMARY KEY,
-            count INTEGER DEFAULT 0
-        )
-    ''')
+    with get_db() as conn:
+        row = conn.execute('SELECT degencoins FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+def _remember_user_profile(user_id: int, profile: tuple):
+    """Record the profile fields last written for a user"""
+    with _user_profiles_lock:
+        _user_profiles[user_id] = profile
+        _user_profiles.move_to_end(user_id)
+        while len(_user_profiles) > USER_PROFILE_CACHE_SIZE:
+            _user_profiles.popitem(last=False)
+
+def upsert_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> bool:
+    """
+    Insert user or update changed profile fields.
+    Returns False without touching the database when the profile is unchanged.
+    """
+    profile = (username, first_name, last_name)
+    with _user_profiles_lock:
+        known = _user_profiles.get(user_id)
+        if known == profile:
+            _user_profiles.move_to_end(user_id)
+            return False
+    if known is None:
+        with _user_cache_lock:
+            cached = _user_cache.get(user_id)
+            known = tuple(cached[f] for f in USER_PROFILE_FIELDS) if cached else None
+        if known == profile:
+            _remember_user_profile(user_id, profile)
+            return False
     
-    # Create indexes for better performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_chat_id ON chat_history(chat_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_thread_id ON chat_history(message_thread_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_from_user ON transactions(from_user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_to_user ON transactions(to_user_id)')
+    if known is None:
+        # Unknown to this process: only rewrite the row if a field actually differs
+        changed = USER_PROFILE_FIELDS
+        distinct = 'IS DISTINCT FROM' if BACKEND == 'postgres' else 'IS NOT'
+        condition = ' OR '.join(f'users.{f} {distinct} excluded.{f}' for f in changed)
+    else:
+        changed = tuple(f for f, old, new in zip(USER_PROFILE_FIELDS, known, profile) if old != new)
+        condition = 'TRUE'
+    assignments = ', '.join(f'{f} = excluded.{f}' for f in changed)
     
-    conn.commit()
-    conn.close()
-
-def get_user_data(user_id: int) -> Optional[Dict]:
-    """Get user data from database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with get_db() as conn:
+        conn.execute(f'''
+            INSERT INTO users (user_id, username, first_name, last_name)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET {assignments}, updated_at = CURRENT_TIMESTAMP
+            WHERE {condition}
+        ''', (user_id, username, first_name, last_name))
     
-    if row:
-        return {
-            'user_id': row[0],
-            'username': row[1],
-            'first_name': row[2],
-            'last_name': row[3],
-            'timezone': row[4],
-            'degencoins': row[5],
-            'daily_streak': row[6],
-            'last_daily_claim': row[7],
-            'total_fights': row[8],
-            'fights_won': row[9],
-            'total_tips_sent': row[10],
-            'total_tips_received': row[11],
-            'achievements': row[12],
-            'created_at': row[13],
-            'updated_at': row[14]
-        }
-    return None
+    _remember_user_profile(user_id, profile)
+    _index_user_names(user_id, username, first_name, previous=known)
+    update_cached_user(user_id, **dict(zip(USER_PROFILE_FIELDS, profile)))
+    return True
 
-def upsert_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-    """Insert or update user in database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, degencoins, updated_at)
-        VALUES (?, ?, ?, ?, COALESCE((SELECT degencoins FROM users WHERE user_id = ?), 1000), CURRENT_TIMESTAMP)
-    ''', (user_id, username, first_name, last_name, user_id))
-    
-    conn.commit()
-    conn.close()
+def ensure_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> Optional[User]:
+    """Upsert a user and return their record, usually straight from the cache"""
+    upsert_user(user_id, username, first_name, last_name)
+    return get_user_data(user_id)
 
 def update_user_degencoins(user_id: int, amount: int):
     """Update user degencoins in database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET degencoins = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (amount, user_id))
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        conn.execute('UPDATE users SET degencoins = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (amount, user_id))
+    update_cached_user(user_id, degencoins=amount)
 
 def update_user_timezone(user_id: int, timezone: str):
     """Update user timezone in database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET timezone = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (timezone, user_id))
-    conn.commit()
-    conn.close()
-
-def get_user_by_username(username: str) -> Optional[Dict]:
-    """Get user data by username from database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE username = ? OR first_name = ?', (username, username))
-    row = cursor.fetchone()
-    conn.close()
+    with get_db() as conn:
+        conn.execute('UPDATE users SET timezone = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?', (timezone, user_id))
+    update_cached_user(user_id, timezone=timezone)
+
+def update_user_achievements(user_id: int, achievements: list):
+    """Update user achievements in database"""
+    achievements_json = json.dumps(achievements)
+    with get_db() as conn:
+        conn.execute('UPDATE users SET achievements = ? WHERE user_id = ?', (achievements_json, user_id))
+    update_cached_user(user_id, achievements=achievements_json)
+
+def _name_key(name: Optional[str]) -> Optional[str]:
+    """Normalize a username or first name for case-insensitive lookup"""
+    if not name:
+        return None
+    return name.lstrip('@').lower()
+
+def _index_user_names(user_id: int, username: Optional[str], first_name: Optional[str], previous: tuple = None):
+    """Point the directory at a user's current names, dropping their old ones"""
+    with _user_directory_lock:
+        if previous:
+            for index, old_name in ((_username_index, previous[0]), (_first_name_index, previous[1])):
+                old_key = _name_key(old_name)
+                if old_key and index.get(old_key) == user_id:
+                    del index[old_key]
+        username_key = _name_key(username)
+        if username_key:
+            _username_index[username_key] = user_id
+        first_name_key = _name_key(first_name)
+        if first_name_key:
+            _first_name_index[first_name_key] = user_id
+
+def load_user_directory():
+    """Load every user's names into the in-memory directory"""
+    with get_db() as conn:
+        rows = conn.execute('SELECT user_id, username, first_name FROM users').fetchall()
+    with _user_directory_lock:
+        _username_index.clear()
+        _first_name_index.clear()
+    for user_id, username, first_name in rows:
+        _index_user_names(user_id, username, first_name)
+
+def find_user_id_by_name(name: str) -> Optional[int]:
+    """Resolve a username or first name to a user ID, case-insensitively"""
+    key = _name_key(name)
+    if not key:
+        return None
+    with _user_directory_lock:
+        user_id = _username_index.get(key)
+        if user_id is None:
+            user_id = _first_name_index.get(key)
+    if user_id is not None:
+        return user_id
     
-    if row:
-        return {
-            'user_id': row[0],
-            'username': row[1],
-            'first_name': row[2],
-            'last_name': row[3],
-            'timezone': row[4],
-            'degencoins': row[5],
-            'daily_streak': row[6],
-            'last_daily_claim': row[7],
-            'total_fights': row[8],
-            'fights_won': row[9],
-            'total_tips_sent': row[10],
-            'total_tips_received': row[11],
-            'achievements': row[12],
-            'created_at': row[13],
-            'updated_at': row[14]
-        }
-    return None
+    # Directory miss, e.g. a row written by another process: use the lowercase indexes
+    with get_db() as conn:
+        row = conn.execute('SELECT user_id, username, first_name FROM users WHERE lower(username) = ? LIMIT 1', (key,)).fetchone()
+        if row is None:
+            row = conn.execute('SELECT user_id, username, first_name FROM users WHERE lower(first_name) = ? LIMIT 1', (key,)).fetchone()
+    if row is None:
+        return None
+    _index_user_names(*row)
+    return row[0]
+
+def get_user_by_username(username: str) -> Optional[User]:
+    """Get user data by username or first name, case-insensitively"""
+    user_id = find_user_id_by_name(username)
+    if user_id is None:
+        return None
+    
+    user = get_user_data(user_id)
+    key = _name_key(username)
+    if user and key not in (_name_key(user.username), _name_key(user.first_name)):
+        # Stale directory entry, the user has been renamed since
+        with _user_directory_lock:
+            for index in (_username_index, _first_name_index):
+                if index.get(key) == user_id:
+                    del index[key]
+        user_id = find_user_id_by_name(username)
+        return get_user_data(user_id) if user_id is not None else None
+    return user
 
 def get_all_user_timezones():
     """Get all users with timezones from database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id, username, first_name, last_name, timezone FROM users WHERE timezone IS NOT NULL ORDER BY first_name, username')
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    with get_db() as conn:
+        return conn.execute('SELECT user_id, username, first_name, last_name, timezone FROM users WHERE timezone IS NOT NULL ORDER BY first_name, username').fetchall()
 
 def get_chat_user_timezones(chat_id: int):
-    """Get users with timezones who have been active in the specific chat"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT DISTINCT u.user_id, u.username, u.first_name, u.last_name, u.timezone 
-        FROM users u
-        INNER JOIN chat_history ch ON u.user_id = ch.user_id
-        WHERE u.timezone IS NOT NULL 
-        AND ch.chat_id = ?
-        ORDER BY u.first_name, u.username
-    ''', (chat_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    """Get members of the specific chat who have set a timezone"""
+    with get_db() as conn:
+        return conn.execute('''
+            SELECT u.user_id, u.username, u.first_name, u.last_name, u.timezone 
+            FROM chat_members cm
+            INNER JOIN users u ON u.user_id = cm.user_id
+            WHERE cm.chat_id = ?
+            AND u.timezone IS NOT NULL 
+            ORDER BY u.first_name, u.username
+        ''', (chat_id,)).fetchall()
 
 def log_transaction(from_user_id: int, to_user_id: int, amount: int, transaction_type: str, description: str):
     """Log transaction to database"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, description)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (from_user_id, to_user_id, amount, transaction_type, description))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with get_db() as conn:
+        conn.execute('''
+            INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, description)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (from_user_id, to_user_id, amount, transaction_type, description))
+
+
+# Column order of the rows built by the message handler
+CHAT_HISTORY_INSERT_COLUMNS = (
+    'message_id', 'user_id', 'username', 'first_name', 'last_name',
+    'chat_id', 'chat_title', 'chat_type', 'message_text', 'message_type',
+    'media_file_id', 'reply_to_message_id', 'forward_from_user_id',
+    'edit_date', 'message_thread_id'
+)
+
+def insert_chat_history_batch(rows: list):
+    """Insert audited message rows into chat history in one transaction"""
+    with get_db() as conn:
+        if BACKEND == 'postgres':
+            conn.copy_rows('chat_history', CHAT_HISTORY_INSERT_COLUMNS, rows)
+        else:
+            placeholders = ', '.join('?' * len(CHAT_HISTORY_INSERT_COLUMNS))
+            conn.executemany(
+                f"INSERT INTO chat_history ({', '.join(CHAT_HISTORY_INSERT_COLUMNS)}) VALUES ({placeholders})",
+                rows
+            )
+
+        # Membership and stats are written once per speaker and chat rather than per message
+        message_counts = {}
+        chat_counts = {}
+        for row in rows:
+            user_id, chat_id = row[1], row[5]
+            chat_counts[chat_id] = chat_counts.get(chat_id, 0) + 1
+            if user_id is not None:
+                message_counts[(chat_id, user_id)] = message_counts.get((chat_id, user_id), 0) + 1
+        
+        new_members = {}
+        user_counts = {}
+        for (chat_id, user_id), count in message_counts.items():
+            user_counts[user_id] = user_counts.get(user_id, 0) + count
+            cursor = conn.execute('''
+                INSERT INTO chat_members (chat_id, user_id, first_seen, last_seen, message_count)
+                VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?)
+                ON CONFLICT(chat_id, user_id) DO NOTHING
+            ''', (chat_id, user_id, count))
+            if cursor.rowcount == 1:
+                new_members[chat_id] = new_members.get(chat_id, 0) + 1
+            else:
+                conn.execute('''
+                    UPDATE chat_members SET last_seen = CURRENT_TIMESTAMP, message_count = message_count + ?
+                    WHERE chat_id = ? AND user_id = ?
+                ''', (count, chat_id, user_id))
+        
+        conn.executemany('''
+            INSERT INTO user_stats (user_id, messages) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET messages = user_stats.messages + excluded.messages
+        ''', list(user_counts.items()))
+        conn.executemany('''
+            INSERT INTO chat_stats (chat_id, messages, members, last_message_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                messages = chat_stats.messages + excluded.messages,
+                members = chat_stats.members + excluded.members,
+                last_message_at = excluded.last_message_at
+        ''', [(chat_id, count, new_members.get(chat_id, 0)) for chat_id, count in chat_counts.items()])
+
+def save_fight_history(fight_type: str, chat_id: int, participants: list, winner_id: int, winner_name: str,
+                       bet_amount: int, total_pot: int, turns_taken: int, fight_scenario: str, fight_log: list):
+    """Record a finished fight and update fight stats; each participant carries its 'stake'"""
+    with get_db() as conn:
+        conn.execute('''
+            INSERT INTO fight_history (
+                fight_type, chat_id, participants, winner_id, winner_name,
+                bet_amount, total_pot, turns_taken, fight_scenario, fight_log
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (fight_type, chat_id, json.dumps(participants), winner_id, winner_name,
+              bet_amount, total_pot, turns_taken, fight_scenario, json.dumps(fight_log)))
+        
+        # The winner collects the pot, everyone else loses their stake
+        conn.executemany('''
+            INSERT INTO user_stats (user_id, fights, fights_won, coins_won, coins_lost) VALUES (?, 1, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                fights = user_stats.fights + 1,
+                fights_won = user_stats.fights_won + excluded.fights_won,
+                coins_won = user_stats.coins_won + excluded.coins_won,
+                coins_lost = user_stats.coins_lost + excluded.coins_lost
+        ''', [
+            (p['user_id'], 1, total_pot, 0) if p['user_id'] == winner_id else (p['user_id'], 0, 0, p.get('stake', 0))
+            for p in participants
+        ])
+        conn.execute('''
+            INSERT INTO chat_stats (chat_id, fights, coins_wagered) VALUES (?, 1, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                fights = chat_stats.fights + 1,
+                coins_wagered = chat_stats.coins_wagered + excluded.coins_wagered
+        ''', (chat_id, total_pot))
+
+def get_user_stats(user_id: int) -> Optional[UserStats]:
+    """Get a user's aggregate message and fight stats"""
+    with get_db() as conn:
+        return fetch_one(conn, UserStats, f'SELECT {UserStats.columns()} FROM user_stats WHERE user_id = ?', (user_id,))
+
+def get_chat_stats(chat_id: int, top: int = 5):
+    """
+    Get a chat's aggregate stats and its most active members.
+    Returns (ChatStats or None, [(first_name, username, message_count), ...]).
+    """
+    with get_db() as conn:
+        stats = fetch_one(conn, ChatStats, f'SELECT {ChatStats.columns()} FROM chat_stats WHERE chat_id = ?', (chat_id,))
+        top_members = conn.execute('''
+            SELECT u.first_name, u.username, cm.message_count
+            FROM chat_members cm
+            LEFT JOIN users u ON u.user_id = cm.user_id
+            WHERE cm.chat_id = ?
+            ORDER BY cm.message_count DESC LIMIT ?
+        ''', (chat_id, top)).fetchall()
+    return stats, top_members
+
+def get_user_transactions(user_id: int, limit: int = 20) -> List[Transaction]:
+    """Get a user's most recent incoming and outgoing transactions"""
+    with get_db() as conn:
+        return fetch_all(conn, Transaction, f'''
+            SELECT {Transaction.columns()} FROM transactions
+            WHERE from_user_id = ? OR to_user_id = ?
+            ORDER BY id DESC LIMIT ?
+        ''', (user_id, user_id, limit))
+
+def get_recent_fights(chat_id: int, limit: int = 10) -> List[Fight]:
+    """Get the most recent fights in a chat"""
+    with get_db() as conn:
+        return fetch_all(conn, Fight, f'''
+            SELECT {Fight.columns()} FROM fight_history
+            WHERE chat_id = ? ORDER BY id DESC LIMIT ?
+        ''', (chat_id, limit))
+
+def load_authorized_chats() -> int:
+    """Reload the in-memory set of active authorized chats; returns its size"""
+    global _authorized_chats
+    with _authorized_chats_lock:
+        with get_db() as conn:
+            rows = conn.execute('SELECT chat_id FROM authorized_chats WHERE is_active = 1').fetchall()
+        # Swapped in whole so lookups never see a half-filled set
+        _authorized_chats = {chat_id for chat_id, in rows}
+        return len(_authorized_chats)
+
+def is_chat_authorized(chat_id: int) -> bool:
+    """Check if chat is authorized to use the bot"""
+    return chat_id in _authorized_chats
+
+def add_authorized_chat(chat_id: int, chat_title: str, chat_type: str, approved_by: int):
+    """Add chat to authorized list"""
+    with _authorized_chats_lock:
+        with get_db() as conn:
+            conn.execute('''
+                INSERT INTO authorized_chats (chat_id, chat_title, chat_type, approved_by)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    chat_title = excluded.chat_title,
+                    chat_type = excluded.chat_type,
+                    approved_by = excluded.approved_by,
+                    approved_at = CURRENT_TIMESTAMP,
+                    is_active = 1
+            ''', (chat_id, chat_title, chat_type, approved_by))
+        _authorized_chats.add(chat_id)
+
+def revoke_authorized_chat(chat_id: int) -> bool:
+    """Deactivate a chat's authorization; False if it was not active"""
+    with _authorized_chats_lock:
+        with get_db() as conn:
+            cursor = conn.execute('UPDATE authorized_chats SET is_active = 0 WHERE chat_id = ? AND is_active = 1',
+                                  (chat_id,))
+        _authorized_chats.discard(chat_id)
+    return cursor.rowcount == 1
+
+def save_access_request(chat_id: int, chat_title: str, chat_type: str, requested_by: int, username: str, message: str) -> int:
+    """Save chat access request to database and return its ID"""
+    query = '''
+        INSERT INTO chat_access_requests (chat_id, chat_title, chat_type, requested_by, requested_by_username, request_message)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    params = (chat_id, chat_title, chat_type, requested_by, username, message)
+    with get_db() as conn:
+        if BACKEND == 'postgres':
+            return conn.execute(query + ' RETURNING id', params).fetchone()[0]
+        return conn.execute(query, params).lastrowid
+
+def update_access_request_status(request_id: int, status: str, processed_by: int):
+    """Update access request status"""
+    with get_db() as conn:
+        conn.execute('''
+            UPDATE chat_access_requests 
+            SET status = ?, processed_at = CURRENT_TIMESTAMP, processed_by = ?
+            WHERE id = ?
+        ''', (status, processed_by, request_id))
+
+def get_access_request(request_id: int) -> Optional[AccessRequest]:
+    """Get access request by ID"""
+    with get_db() as conn:
+        return fetch_one(conn, AccessRequest,
+                         f'SELECT {AccessRequest.columns()} FROM chat_access_requests WHERE id = ?', (request_id,))
+
+def reserve_draw_quota(user_id: int, day: str, limit: int) -> bool:
+    """Take one image from a user's quota for the day; False once the limit is reached"""
+    with get_db() as conn:
+        cursor = conn.execute('''
+            INSERT INTO draw_quota (user_id, day, count) VALUES (?, ?, 1)
+            ON CONFLICT(user_id, day) DO UPDATE SET count = draw_quota.count + 1 WHERE draw_quota.count < ?
+        ''', (user_id, day, limit))
+    return cursor.rowcount == 1
+
+def release_draw_quota(user_id: int, day: str):
+    """Give back a reserved image after a failed generation"""
+    with get_db() as conn:
+        conn.execute('UPDATE draw_quota SET count = count - 1 WHERE user_id = ? AND day = ? AND count > 0',
+                     (user_id, day))
+
+def purge_draw_history(max_age_days: int = DRAW_HISTORY_RETENTION_DAYS) -> int:
+    """Delete draw log entries and quota counters older than max_age_days; returns rows removed"""
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    with get_db() as conn:
+        removed = conn.execute('DELETE FROM draw_requests WHERE timestamp < ?',
+                               (cutoff.strftime('%Y-%m-%d %H:%M:%S'),)).rowcount
+        removed += conn.execute('DELETE FROM draw_quota WHERE day < ?', (cutoff.strftime('%Y-%m-%d'),)).rowcount
+    return removed
+
+def log_draw_request(user_id: int, timestamp):
+    """Record an image generation for daily limits and the user's image counter"""
+    with get_db() as conn:
+        conn.execute('INSERT INTO draw_requests (user_id, timestamp) VALUES (?, ?)', (user_id, timestamp))
+        conn.execute('UPDATE users SET images_generated = images_generated + 1 WHERE user_id = ?', (user_id,))
+        row = conn.execute('SELECT images_generated FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    if row:
+        update_cached_user(user_id, images_generated=row[0])
+
+def increment_cunt_counter(chat_id: int) -> int:
+    """Increment the word counter for a chat and return the new count"""
+    with get_db() as conn:
+        conn.execute('''
+            INSERT INTO cunt_counter (chat_id, count) VALUES (?, 1) 
+            ON CONFLICT(chat_id) DO UPDATE SET count = cunt_counter.count + 1
+        ''', (chat_id,))
+        return conn.execute('SELECT count FROM cunt_counter WHERE chat_id = ?', (chat_id,)).fetchone()[0]
+
+def search_chat_history(chat_id: int, terms: str, message_thread_id: int = None, limit: int = 10, offset: int = 0):
+    """
+    Ranked full-text search of one chat's history, optionally limited to a forum topic.
+    Returns (rows, has_more); each row is (first_name, username, snippet, timestamp).
+    """
+    # Quote every word so user input cannot inject FTS5 query syntax
+    match = ' '.join('"' + word.replace('"', '""') + '"' for word in terms.split())
+    if not match:
+        return [], False
+    
+    if BACKEND == 'postgres':
+        # plainto_tsquery treats the input as plain words, so it needs no quoting
+        query = '''
+            SELECT ch.first_name, ch.username,
+                   ts_headline('simple', ch.message_text, q, 'StartSel=«, StopSel=», MaxWords=12, MinWords=4'),
+                   ch.timestamp
+            FROM chat_history ch, plainto_tsquery('simple', ?) q
+            WHERE to_tsvector('simple', coalesce(ch.message_text, '')) @@ q AND ch.chat_id = ?
+        '''
+        params = [terms, chat_id]
+        order = "ts_rank(to_tsvector('simple', coalesce(ch.message_text, '')), q) DESC"
+    else:
+        query = '''
+            SELECT ch.first_name, ch.username,
+                   snippet(chat_history_fts, 0, '«', '»', '…', 12), ch.timestamp
+            FROM chat_history_fts
+            JOIN chat_history ch ON ch.id = chat_history_fts.rowid
+            WHERE chat_history_fts MATCH ? AND ch.chat_id = ?
+        '''
+        params = [match, chat_id]
+        order = 'chat_history_fts.rank'
+    if message_thread_id is not None:
+        query += ' AND ch.message_thread_id = ?'
+        params.append(message_thread_id)
+    query += f' ORDER BY {order} LIMIT ? OFFSET ?'
+    params += [limit + 1, offset]
+    
+    with get_db() as conn:
+        rows = conn.execute(query, params).fetchall()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,111 @@
+"""
+PostgreSQL connection pool exposing the sqlite3 connection API used by models
+"""
+import functools
+import threading
+from config.settings import DATABASE_URL, POSTGRES_POOL_SIZE
+
+# Connections kept open per worker process
+POSTGRES_POOL_MIN_SIZE = 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=512)
+def translate_query(query: str) -> str:
+    """Convert sqlite3 qmark placeholders to psycopg format placeholders"""
+    # Literal percent signs must be doubled once %s becomes the placeholder
+    return query.replace('%', '%%').replace('?', '%s')
+
+def _open_pool():
+    """Create the process-wide connection pool on first use"""
+    global _pool
+    # Imported here so SQLite deployments do not need psycopg installed
+    from psycopg_pool import ConnectionPool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DATABASE_URL, min_size=POSTGRES_POOL_MIN_SIZE, max_size=POSTGRES_POOL_SIZE, open=True)
+    return _pool
+
+def close_pool():
+    """Close the pool and every pooled connection"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+class PostgresCursor:
+    """A psycopg cursor with a sqlite3-style row_factory"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.row_factory = None
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query: str, params=()):
+        self._cursor.execute(translate_query(query), params)
+        return self
+
+    def executemany(self, query: str, params_seq):
+        self._cursor.executemany(translate_query(query), params_seq)
+        return self
+
+    def _convert(self, row):
+        if row is None or self.row_factory is None:
+            return row
+        return self.row_factory(self, row)
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._convert(row)
+
+class PostgresConnection:
+    """A pooled psycopg connection used through the sqlite3 connection methods"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self) -> PostgresCursor:
+        return PostgresCursor(self.raw.cursor())
+
+    def execute(self, query: str, params=()) -> PostgresCursor:
+        return self.cursor().execute(query, params)
+
+    def executemany(self, query: str, params_seq) -> PostgresCursor:
+        return self.cursor().executemany(query, params_seq)
+
+    def copy_rows(self, table: str, columns: tuple, rows):
+        """Bulk load rows with COPY FROM STDIN"""
+        with self.raw.cursor() as cursor:
+            with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+def acquire() -> PostgresConnection:
+    """Borrow a connection from the pool"""
+    pool = _pool or _open_pool()
+    return PostgresConnection(pool.getconn())
+
+def release(conn: PostgresConnection):
+    """Return a borrowed connection to the pool"""
+    _pool.putconn(conn.raw)
@@ -0,0 +1,87 @@
+"""
+Slotted row objects for database records
+"""
+from typing import List, Optional
+
+class Record:
+    """Base for row objects; fields are read as attributes or with record['field']"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 row factory for queries selecting cls.columns()"""
+        return cls(*row)
+
+    @classmethod
+    def columns(cls) -> str:
+        """Column list matching the slot order, for SELECT statements"""
+        return ', '.join(cls.__slots__)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def copy(self):
+        return type(self)(*(getattr(self, name, None) for name in self.__slots__))
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name, None) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name, None)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+class User(Record):
+    __slots__ = (
+        'user_id', 'username', 'first_name', 'last_name', 'timezone', 'degencoins',
+        'daily_streak', 'last_daily_claim', 'total_fights', 'fights_won',
+        'total_tips_sent', 'total_tips_received', 'achievements', 'created_at',
+        'updated_at', 'images_generated'
+    )
+
+class AccessRequest(Record):
+    __slots__ = (
+        'id', 'chat_id', 'chat_title', 'chat_type', 'requested_by', 'requested_by_username',
+        'request_message', 'status', 'created_at', 'processed_at', 'processed_by'
+    )
+
+class Transaction(Record):
+    __slots__ = (
+        'id', 'from_user_id', 'to_user_id', 'amount', 'transaction_type', 'description', 'timestamp'
+    )
+
+class Fight(Record):
+    __slots__ = (
+        'id', 'fight_type', 'chat_id', 'participants', 'winner_id', 'winner_name', 'bet_amount',
+        'total_pot', 'turns_taken', 'fight_scenario', 'fight_log', 'timestamp'
+    )
+
+class UserStats(Record):
+    __slots__ = ('user_id', 'messages', 'fights', 'fights_won', 'coins_won', 'coins_lost')
+
+class ChatStats(Record):
+    __slots__ = ('chat_id', 'messages', 'members', 'fights', 'coins_wagered', 'last_message_at')
+
+def fetch_one(conn, record_type, query: str, params=()) -> Optional[Record]:
+    """Run a query and map its first row to record_type"""
+    cursor = conn.cursor()
+    cursor.row_factory = record_type.from_row
+    return cursor.execute(query, params).fetchone()
+
+def fetch_all(conn, record_type, query: str, params=()) -> List[Record]:
+    """Run a query and map every row to record_type"""
+    cursor = conn.cursor()
+    cursor.row_factory = record_type.from_row
+    return cursor.execute(query, params).fetchall()
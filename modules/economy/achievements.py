@@ -2,8 +2,9 @@
 Achievement system for degencoins economy
 """
 import json
-import sqlite3
-from modules.database.models import get_user_data, update_user_degencoins, log_transaction, DATABASE_FILE
+from modules.database.connection import get_db
+from modules.database.models import get_user_data, update_user_achievements
+from modules.economy.ledger import settle
 
 def check_and_award_achievements(user_id: int, achievement_type: str, count: int = 1):
     """Check and award achievements to users"""
@@ -38,20 +39,15 @@ def check_and_award_achievements(user_id: int, achievement_type: str, count: int
             if requirements_met:
                 current_achievements.append(achievement_id)
                 new_achievements.append(requirements)
-                
-                # Award achievement reward
-                new_balance = user_data['degencoins'] + requirements['reward']
-                update_user_degencoins(user_id, new_balance)
-                log_transaction(0, user_id, requirements['reward'], 'achievement', f"Achievement: {requirements['title']}")
     
-    # Update achievements in database
+    # Award rewards and update achievements in one transaction
     if new_achievements:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET achievements = ? WHERE user_id = ?', 
-                      (json.dumps(current_achievements), user_id))
-        conn.commit()
-        conn.close()
+        with get_db():
+            settle([
+                (user_id, achievement['reward'], 'achievement', f"Achievement: {achievement['title']}")
+                for achievement in new_achievements
+            ])
+            update_user_achievements(user_id, current_achievements)
     
     return new_achievements
 
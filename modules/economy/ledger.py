@@ -0,0 +1,91 @@
+"""
+Atomic degencoin balance operations
+"""
+from typing import Dict, List, Tuple
+from modules.database.connection import get_db
+from modules.database.models import update_cached_user
+
+# User ID used as the counterparty for coins entering or leaving the economy
+SYSTEM_USER_ID = 0
+
+class InsufficientFunds(Exception):
+    """Raised when a debit would take a balance below zero"""
+
+    def __init__(self, user_id: int, amount: int):
+        super().__init__(f"User {user_id} cannot afford {amount} degencoins")
+        self.user_id = user_id
+        self.amount = amount
+
+def _apply_delta(conn, user_id: int, delta: int) -> int:
+    """Change a balance in place and return the new balance"""
+    if delta < 0:
+        cursor = conn.execute('''
+            UPDATE users SET degencoins = degencoins + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ? AND degencoins >= ?
+        ''', (delta, user_id, -delta))
+        if cursor.rowcount == 0:
+            raise InsufficientFunds(user_id, -delta)
+    else:
+        cursor = conn.execute('''
+            UPDATE users SET degencoins = degencoins + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (delta, user_id))
+        if cursor.rowcount == 0:
+            raise ValueError(f"Unknown user {user_id}")
+    return conn.execute('SELECT degencoins FROM users WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+def _log(conn, from_user_id: int, to_user_id: int, amount: int, transaction_type: str, description: str):
+    """Record a balance change in the transactions table"""
+    conn.execute('''
+        INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, description)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (from_user_id, to_user_id, amount, transaction_type, description))
+
+def _write_through(balances: Dict[int, int]):
+    """Push committed balances into the user cache"""
+    for user_id, balance in balances.items():
+        update_cached_user(user_id, degencoins=balance)
+
+def credit(user_id: int, amount: int, transaction_type: str, description: str,
+           from_user_id: int = SYSTEM_USER_ID) -> int:
+    """Add coins to a user and log it; returns the new balance"""
+    with get_db() as conn:
+        balance = _apply_delta(conn, user_id, amount)
+        _log(conn, from_user_id, user_id, amount, transaction_type, description)
+    _write_through({user_id: balance})
+    return balance
+
+def debit(user_id: int, amount: int, transaction_type: str, description: str,
+          to_user_id: int = SYSTEM_USER_ID) -> int:
+    """Take coins from a user and log it; raises InsufficientFunds instead of going negative"""
+    with get_db() as conn:
+        balance = _apply_delta(conn, user_id, -amount)
+        _log(conn, user_id, to_user_id, amount, transaction_type, description)
+    _write_through({user_id: balance})
+    return balance
+
+def transfer(from_user_id: int, to_user_id: int, amount: int, transaction_type: str, description: str) -> Tuple[int, int]:
+    """Move coins between users in one transaction; returns both new balances"""
+    with get_db() as conn:
+        from_balance = _apply_delta(conn, from_user_id, -amount)
+        to_balance = _apply_delta(conn, to_user_id, amount)
+        _log(conn, from_user_id, to_user_id, amount, transaction_type, description)
+    _write_through({from_user_id: from_balance, to_user_id: to_balance})
+    return from_balance, to_balance
+
+def settle(entries: List[Tuple[int, int, str, str]]) -> Dict[int, int]:
+    """
+    Apply several balance changes as one batch.
+    Each entry is (user_id, delta, transaction_type, description); either all apply or none do.
+    Returns the new balance of every user touched.
+    """
+    balances = {}
+    with get_db() as conn:
+        for user_id, delta, transaction_type, description in entries:
+            balances[user_id] = _apply_delta(conn, user_id, delta)
+            if delta >= 0:
+                _log(conn, SYSTEM_USER_ID, user_id, delta, transaction_type, description)
+            else:
+                _log(conn, user_id, SYSTEM_USER_ID, -delta, transaction_type, description)
+    _write_through(balances)
+    return balances
@@ -2,12 +2,10 @@
 Access request handler
 """
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import BadRequest, Forbidden
-from modules.auth.authorization import save_access_request
-from modules.database.models import DATABASE_FILE
-from utils.reply_helper import reply_to_message
+from modules.auth.authorization import get_bot_status
+from modules.database import async_db
+from utils.reply_helper import reply_to_message, send_message_to_chat
 from config.logging_config import logger
-import sqlite3
 
 async def request_access(update, context):
     """Handle access requests for chats"""
@@ -19,25 +17,24 @@ async def request_access(update, context):
         return
     
     # Check if bot is admin
-    try:
-        bot_member = await context.bot.get_chat_member(chat.id, context.bot.id)
-        if bot_member.status not in ['administrator', 'creator']:
-            await reply_to_message(update, context,
-                "❌ I need to be an **administrator** in this chat first!\n\n"
-                "Please make me an admin with these permissions:\n"
-                "• Read messages\n"
-                "• Send messages\n"
-                "• Delete messages",
-                parse_mode='Markdown'
-            )
-            return
-    except (BadRequest, Forbidden):
+    status = await get_bot_status(context, chat.id)
+    if status is None:
         await reply_to_message(update, context, "❌ Cannot check my permissions in this chat.")
         return
+    if status not in ['administrator', 'creator']:
+        await reply_to_message(update, context,
+            "❌ I need to be an **administrator** in this chat first!\n\n"
+            "Please make me an admin with these permissions:\n"
+            "• Read messages\n"
+            "• Send messages\n"
+            "• Delete messages",
+            parse_mode='Markdown'
+        )
+        return
     
     # Save access request
     request_message = ' '.join(context.args) if context.args else "Access request"
-    save_access_request(
+    request_id = await async_db.save_access_request(
         chat.id, 
         chat.title or "Unknown Chat", 
         chat.type, 
@@ -46,13 +43,6 @@ async def request_access(update, context):
         request_message
     )
     
-    # Get the latest request ID
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM chat_access_requests ORDER BY id DESC LIMIT 1')
-    request_id = cursor.fetchone()[0]
-    conn.close()
-    
     admin_user_id = context.bot_data.get('admin_user_id')
     if not admin_user_id:
         await reply_to_message(update, context, "❌ Admin not configured.")
@@ -76,11 +66,10 @@ async def request_access(update, context):
     )
     
     try:
-        await context.bot.send_message(
-            chat_id=admin_user_id,
-            text=admin_message,
+        await send_message_to_chat(context, admin_user_id, admin_message,
             reply_markup=reply_markup,
-            parse_mode='Markdown'
+            parse_mode='Markdown',
+            wait=True
         )
         
         await reply_to_message(update, context,
@@ -94,4 +83,26 @@ async def request_access(update, context):
         logger.error(f"Failed to send access request to admin: {e}")
         await reply_to_message(update, context,
             "❌ Failed to send access request. Please try again later."
-        )
\ No newline at end of file
+        )
+
+async def revoke_access(update, context):
+    """Deactivate a chat's authorization: /revoke [chat_id] (admin only)"""
+    if update.effective_user.id != context.bot_data.get('admin_user_id'):
+        return
+    
+    try:
+        chat_id = int(context.args[0]) if context.args else update.effective_chat.id
+    except ValueError:
+        await reply_to_message(update, context, "Usage: `/revoke [chat_id]`", parse_mode='Markdown')
+        return
+    
+    if not await async_db.revoke_authorized_chat(chat_id):
+        await reply_to_message(update, context, f"❌ Chat `{chat_id}` is not authorized.", parse_mode='Markdown')
+        return
+    
+    logger.info(f"Authorization revoked for chat {chat_id} by {update.effective_user.id}")
+    await reply_to_message(update, context,
+        f"🚫 **Access Revoked**\n\nChat `{chat_id}` can no longer use the bot.\n"
+        "It can ask again with `/request_access`.",
+        parse_mode='Markdown'
+    )
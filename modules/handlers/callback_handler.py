@@ -1,9 +1,8 @@
 """
 Callback query handler for button interactions
 """
-from modules.auth.authorization import get_access_request, update_access_request_status, add_authorized_chat
+from modules.database import async_db
 from utils.reply_helper import send_message_to_chat
-from utils.user_helper import ensure_user_in_database
 from config.logging_config import logger
 
 async def handle_callback_query(update, context):
@@ -11,9 +10,6 @@ async def handle_callback_query(update, context):
     query = update.callback_query
     await query.answer()
     
-    # Ensure user exists in database
-    ensure_user_in_database(update)
-    
     callback_data = query.data
     admin_user_id = context.bot_data.get('admin_user_id')
     
@@ -23,6 +19,12 @@ async def handle_callback_query(update, context):
         await handle_fight_callback(update, context)
         return
     
+    # Handle search pagination
+    if callback_data.startswith('search_page_'):
+        from modules.commands.search import handle_search_callback
+        await handle_search_callback(update, context)
+        return
+    
     # Handle access approval/denial (admin only)
     if callback_data.startswith('approve_access_') or callback_data.startswith('deny_access_'):
         if query.from_user.id != admin_user_id:
@@ -33,23 +35,23 @@ async def handle_callback_query(update, context):
         request_id = int(request_id)
         
         # Get request details
-        request_data = get_access_request(request_id)
+        request_data = await async_db.get_access_request(request_id)
         if not request_data:
             await query.edit_message_text("❌ Request not found or already processed.")
             return
         
-        chat_id, chat_title, chat_type = request_data[1], request_data[2], request_data[3]
+        chat_id, chat_title, chat_type = request_data.chat_id, request_data.chat_title, request_data.chat_type
         
         if action == 'approve_access':
             # Approve the chat
-            add_authorized_chat(chat_id, chat_title, chat_type, admin_user_id)
-            update_access_request_status(request_id, 'approved', admin_user_id)
+            await async_db.add_authorized_chat(chat_id, chat_title, chat_type, admin_user_id)
+            await async_db.update_access_request_status(request_id, 'approved', admin_user_id)
             
             # Notify the chat
             try:
                 await send_message_to_chat(context, chat_id, 
                     "✅ **Access Approved!**\n\nYour chat has been authorized to use this bot.\nUse /start to begin!",
-                    parse_mode='Markdown'
+                    parse_mode='Markdown', wait=True
                 )
             except Exception as e:
                 logger.error(f"Failed to notify approved chat {chat_id}: {e}")
@@ -62,13 +64,15 @@ async def handle_callback_query(update, context):
             )
         
         elif action == 'deny_access':
-            update_access_request_status(request_id, 'denied', admin_user_id)
+            await async_db.update_access_request_status(request_id, 'denied', admin_user_id)
+            # A denied chat loses any authorization it had before
+            await async_db.revoke_authorized_chat(chat_id)
             
             # Notify the chat
             try:
                 await send_message_to_chat(context, chat_id,
                     "❌ **Access Denied**\n\nYour access request has been denied.\nContact the bot admin for more information.",
-                    parse_mode='Markdown'
+                    parse_mode='Markdown', wait=True
                 )
             except Exception as e:
                 logger.error(f"Failed to notify denied chat {chat_id}: {e}")
@@ -114,10 +118,14 @@ async def handle_callback_query(update, context):
         'tip': "💰 **Tip Degencoins**\n\nUse `/tip <username> <amount>` to tip degencoins.",
         'askgpt': "🤖 **Ask GPT**\n\nUse `/ask <question>` to ask GPT anything!",
         'draw': "🎨 **AI Art**\n\nUse `/draw_me <prompt>` to generate AI images.",
-        'stats': "📊 **Statistics**\n\nComing soon!"
     }
     
-    if action in action_responses:
+    if action == 'stats':
+        from modules.commands.stats import build_user_stats_text
+        display_name = query.from_user.first_name or query.from_user.username or "you"
+        text = await build_user_stats_text(current_user_id, display_name)
+        await query.edit_message_text(text + "\n\nUse `/stats chat` for this chat's stats.", parse_mode='Markdown')
+    elif action in action_responses:
         await query.edit_message_text(action_responses[action], parse_mode='Markdown')
     else:
         await query.edit_message_text("❌ Unknown action.")
\ No newline at end of file
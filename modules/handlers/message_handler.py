@@ -1,10 +1,9 @@
 """
 Enhanced message handler with full auditing and topic support
 """
-import sqlite3
 from telegram import Update, MessageOriginUser
-from modules.auth.authorization import is_chat_authorized
-from modules.database.models import upsert_user, DATABASE_FILE
+from modules.auth.authorization import is_context_authorized
+from modules.database.history_buffer import chat_history_buffer
 from config.logging_config import logger
 
 def get_forward_from_user_id(message):
@@ -17,11 +16,8 @@ def get_forward_from_user_id(message):
     
     return None
 
-def save_enhanced_chat_message(update: Update):
-    """Save comprehensive message data for auditing with topic support"""
-    if not update.message:
-        return
-        
+def build_chat_history_row(update: Update):
+    """Extract comprehensive message data for auditing with topic support"""
     message = update.message
     user = message.from_user
     chat = message.chat
@@ -56,16 +52,7 @@ def save_enhanced_chat_message(update: Update):
     # TOPIC SUPPORT: Extract message thread ID for forums
     message_thread_id = getattr(message, 'message_thread_id', None)
     
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO chat_history (
-            message_id, user_id, username, first_name, last_name,
-            chat_id, chat_title, chat_type, message_text, message_type,
-            media_file_id, reply_to_message_id, forward_from_user_id, 
-            edit_date, message_thread_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    return (
         message.message_id,
         user.id if user else None,
         user.username if user else None,
@@ -81,31 +68,27 @@ def save_enhanced_chat_message(update: Update):
         get_forward_from_user_id(message),
         message.edit_date.timestamp() if message.edit_date else None,
         message_thread_id  # TOPIC SUPPORT: Store thread ID
-    ))
-    conn.commit()
-    conn.close()
+    )
+
+async def save_enhanced_chat_message(update: Update):
+    """Save comprehensive message data for auditing with topic support"""
+    if not update.message:
+        return
+    
+    # Buffered and written in batches by the history flush job
+    await chat_history_buffer.add(build_chat_history_row(update))
 
 async def handle_message(update: Update, context):
     """Handle all incoming messages and save to database with full auditing"""
     if not update.message:
         return
     
-    # Check chat authorization for non-private chats
-    if update.effective_chat.type != 'private':
-        if not is_chat_authorized(update.effective_chat.id):
-            return  # Silently ignore messages from unauthorized chats
-    
-    # Ensure user exists in database
-    if update.effective_user:
-        upsert_user(
-            update.effective_user.id,
-            update.effective_user.username,
-            update.effective_user.first_name,
-            update.effective_user.last_name
-        )
+    # Authorization and the sender's upsert were resolved by the pre-dispatch stage
+    if not is_context_authorized(update, context):
+        return  # Silently ignore messages from unauthorized chats
     
     # Save comprehensive message data for auditing
     try:
-        save_enhanced_chat_message(update)
+        await save_enhanced_chat_message(update)
     except Exception as e:
         logger.error(f"Failed to save message to database: {e}")
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Pre-dispatch stage run once per update before any other handler
+"""
+import time
+from telegram import Update
+from modules.auth.authorization import is_update_authorized
+from utils.user_helper import ensure_user_in_database
+from config.logging_config import logger
+
+# Handler group for the stage; negative groups run before the default group 0
+PRE_DISPATCH_GROUP = -1
+
+# Pre-dispatch work slower than this is logged
+PRE_DISPATCH_WARN_THRESHOLD = 0.25
+
+_pre_dispatch_stats = {
+    'updates': 0,
+    'total': 0.0,
+    'max': 0.0,
+    'slow': 0,
+}
+
+async def pre_dispatch(update: Update, context):
+    """Resolve chat authorization and the sender's record, storing both on context"""
+    started = time.perf_counter()
+
+    # Handlers read context.chat_authorized and context.user_record instead of looking them up again;
+    # the record is as of the start of the update, so handlers that change it must re-read it
+    context.chat_authorized = is_update_authorized(update)
+    context.user_record = None
+    if context.chat_authorized:
+        try:
+            context.user_record = await ensure_user_in_database(update)
+        except Exception as e:
+            logger.error(f"Failed to upsert user for update {update.update_id}: {e}")
+
+    elapsed = time.perf_counter() - started
+    _pre_dispatch_stats['updates'] += 1
+    _pre_dispatch_stats['total'] += elapsed
+    _pre_dispatch_stats['max'] = max(_pre_dispatch_stats['max'], elapsed)
+    if elapsed >= PRE_DISPATCH_WARN_THRESHOLD:
+        _pre_dispatch_stats['slow'] += 1
+        logger.warning(f"Pre-dispatch for update {update.update_id} took {elapsed * 1000:.0f} ms")
+
+def get_pre_dispatch_stats() -> dict:
+    """Get pre-dispatch timing statistics in milliseconds"""
+    updates = _pre_dispatch_stats['updates']
+    return {
+        'updates': updates,
+        'avg_ms': (_pre_dispatch_stats['total'] / updates * 1000) if updates else 0.0,
+        'max_ms': _pre_dispatch_stats['max'] * 1000,
+        'slow': _pre_dispatch_stats['slow'],
+    }
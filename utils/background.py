@@ -0,0 +1,32 @@
+"""
+Background task helpers for periodic maintenance jobs
+"""
+import asyncio
+from config.logging_config import logger
+
+_tasks = set()
+
+def start_background_task(coro, name: str = None) -> asyncio.Task:
+    """Start a task that runs until the bot shuts down"""
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+async def run_periodic(interval: float, func, *args):
+    """Await func(*args) every interval seconds, logging failures"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Periodic job {getattr(func, '__name__', func)} failed: {e}")
+
+async def stop_background_tasks():
+    """Cancel all background tasks and wait for them to finish"""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
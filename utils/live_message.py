@@ -0,0 +1,28 @@
+"""
+Messages edited in place as their content changes
+"""
+from utils.reply_helper import edit_message_in_chat
+
+class LiveMessage:
+    """
+    Renders successive frames into one message.
+    A frame identical to the last one is skipped, and a frame still queued when the next arrives
+    is replaced by it, so a message that falls behind jumps straight to its latest state.
+    """
+
+    def __init__(self, context, chat_id: int, message_id: int, text: str = None):
+        self.context = context
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self._last_text = text
+        self.edits = 0
+        self.skipped = 0
+
+    async def render(self, text: str, final: bool = False, **kwargs):
+        """Show a frame; a final frame is awaited so failures reach the caller"""
+        if text == self._last_text:
+            self.skipped += 1
+            return
+        self._last_text = text
+        self.edits += 1
+        await edit_message_in_chat(self.context, self.chat_id, self.message_id, text, wait=final, **kwargs)
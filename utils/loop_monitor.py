@@ -0,0 +1,45 @@
+"""
+Event loop lag monitoring
+"""
+import asyncio
+from config.logging_config import logger
+
+# How often the loop is probed and when a probe counts as a stall
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_WARN_THRESHOLD = 0.1
+
+_lag_stats = {
+    'samples': 0,
+    'total': 0.0,
+    'max': 0.0,
+    'last': 0.0,
+    'stalls': 0,
+}
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Measure how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+
+        _lag_stats['samples'] += 1
+        _lag_stats['total'] += lag
+        _lag_stats['last'] = lag
+        _lag_stats['max'] = max(_lag_stats['max'], lag)
+
+        if lag >= LOOP_LAG_WARN_THRESHOLD:
+            _lag_stats['stalls'] += 1
+            logger.warning(f"Event loop stalled for {lag * 1000:.0f} ms")
+
+def get_loop_lag_stats() -> dict:
+    """Get loop lag statistics in milliseconds"""
+    samples = _lag_stats['samples']
+    return {
+        'samples': samples,
+        'avg_ms': (_lag_stats['total'] / samples * 1000) if samples else 0.0,
+        'max_ms': _lag_stats['max'] * 1000,
+        'last_ms': _lag_stats['last'] * 1000,
+        'stalls': _lag_stats['stalls'],
+    }
@@ -1,10 +1,41 @@
 """
 Reply helper utilities for topic groups and general message handling
 """
-from telegram import Update
+from telegram import Update, InputMediaPhoto
 from telegram.ext import ContextTypes
+from telegram.error import BadRequest
+from utils.send_queue import send_queue, PRIORITY_REPLY, PRIORITY_NOTIFY, PRIORITY_EDIT
+from config.logging_config import logger
 
-async def reply_to_message(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
+# All sends go through the outbound queue. By default a helper returns as soon as the message is
+# queued, with a future for the sent Message; pass wait=True to get the Message itself.
+
+def _plain_text_fallback(func):
+    """
+    Resend without parse_mode when Telegram can't parse the formatting, e.g. unbalanced * in user text.
+    Queued sends fail after the handler has moved on, so its own except could no longer do this.
+    """
+    async def send(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except BadRequest as e:
+            if "can't parse entities" not in str(e).lower():
+                raise
+            logger.warning(f"Resending without {kwargs.get('parse_mode')} formatting: {e}")
+            kwargs.pop('parse_mode', None)
+            return await func(*args, **kwargs)
+    return send
+
+async def _queue(chat_id: int, func, *args, wait: bool = False, priority: int = PRIORITY_REPLY,
+                 coalesce_key=None, **kwargs):
+    """Queue a Telegram call, awaiting its result only when asked to"""
+    if kwargs.get('parse_mode'):
+        func = _plain_text_fallback(func)
+    future = send_queue.submit(chat_id, func, *args, priority=priority, coalesce_key=coalesce_key, **kwargs)
+    return await future if wait else future
+
+async def reply_to_message(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str,
+                           wait: bool = False, **kwargs):
     """
     Smart reply function that handles topic groups correctly
     """
@@ -18,9 +49,9 @@ async def reply_to_message(update: Update, context: ContextTypes.DEFAULT_TYPE, t
         # Reply in the same topic thread
         kwargs['message_thread_id'] = update.message.message_thread_id
     
-    return await update.message.reply_text(text, **kwargs)
+    return await _queue(update.message.chat_id, update.message.reply_text, text, wait=wait, **kwargs)
 
-async def reply_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, photo, **kwargs):
+async def reply_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, photo, wait: bool = False, **kwargs):
     """
     Smart photo reply function that handles topic groups correctly
     """
@@ -34,24 +65,98 @@ async def reply_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, photo,
         # Reply in the same topic thread
         kwargs['message_thread_id'] = update.message.message_thread_id
     
-    return await update.message.reply_photo(photo=photo, **kwargs)
+    return await _queue(update.message.chat_id, update.message.reply_photo, photo=photo, wait=wait, **kwargs)
+
+# Telegram's limits on items in one media group
+MEDIA_GROUP_MIN_ITEMS = 2
+MEDIA_GROUP_MAX_ITEMS = 10
+
+async def reply_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE, photos, captions=None,
+                            wait: bool = False, **kwargs):
+    """
+    Reply with several photos as albums of up to ten, each photo with its own caption.
+    Albums are split evenly so none is left with a single photo; one photo alone is sent as a plain photo.
+    Returns one entry per album: its messages with wait=True, otherwise a future for them.
+    """
+    if not update.message:
+        return None
+    
+    captions = captions or [None] * len(photos)
+    if len(photos) < MEDIA_GROUP_MIN_ITEMS:
+        return [
+            await reply_photo(update, context, photo, caption=caption, wait=wait, **kwargs)
+            for photo, caption in zip(photos, captions)
+        ]
+    
+    # Check if this is a topic group (forum)
+    if (hasattr(update.message.chat, 'is_forum') and 
+        update.message.chat.is_forum and 
+        update.message.message_thread_id):
+        # Reply in the same topic thread
+        kwargs['message_thread_id'] = update.message.message_thread_id
+    
+    media = [InputMediaPhoto(media=photo, caption=caption) for photo, caption in zip(photos, captions)]
+    albums = -(-len(media) // MEDIA_GROUP_MAX_ITEMS)
+    bounds = [len(media) * i // albums for i in range(albums + 1)]
+    return [
+        await _queue(update.message.chat_id, update.message.reply_media_group,
+                     media=media[start:end], wait=wait, **kwargs)
+        for start, end in zip(bounds, bounds[1:])
+    ]
+
+async def reply_document(update: Update, context: ContextTypes.DEFAULT_TYPE, document, **kwargs):
+    """
+    Smart document reply function that handles topic groups correctly
+    """
+    if not update.message:
+        return None
+    
+    # Check if this is a topic group (forum)
+    if (hasattr(update.message.chat, 'is_forum') and 
+        update.message.chat.is_forum and 
+        update.message.message_thread_id):
+        # Reply in the same topic thread
+        kwargs['message_thread_id'] = update.message.message_thread_id
+    
+    # Waits for the upload, since the caller closes the file afterwards
+    return await _queue(update.message.chat_id, update.message.reply_document, document=document, wait=True, **kwargs)
 
 async def send_message_to_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, 
-                              message_thread_id: int = None, **kwargs):
+                              message_thread_id: int = None, wait: bool = False, **kwargs):
     """
     Send message to chat with optional topic thread support
     """
     if message_thread_id:
         kwargs['message_thread_id'] = message_thread_id
     
-    return await context.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+    return await _queue(chat_id, context.bot.send_message, chat_id=chat_id, text=text,
+                        wait=wait, priority=PRIORITY_NOTIFY, **kwargs)
 
 async def send_photo_to_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, photo, 
-                            message_thread_id: int = None, **kwargs):
+                            message_thread_id: int = None, wait: bool = False, **kwargs):
     """
     Send photo to chat with optional topic thread support
     """
     if message_thread_id:
         kwargs['message_thread_id'] = message_thread_id
     
-    return await context.bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
\ No newline at end of file
+    return await _queue(chat_id, context.bot.send_photo, chat_id=chat_id, photo=photo,
+                        wait=wait, priority=PRIORITY_NOTIFY, **kwargs)
+
+async def edit_message_in_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, text: str,
+                               wait: bool = False, **kwargs):
+    """
+    Edit a message's text; a still-queued edit of the same message is replaced rather than sent twice
+    """
+    async def edit(**edit_kwargs):
+        try:
+            return await context.bot.edit_message_text(**edit_kwargs)
+        except BadRequest as e:
+            # Nothing changed on Telegram's side, which is what the caller wanted
+            if 'not modified' in str(e).lower():
+                return None
+            raise
+
+    return await _queue(chat_id, edit, chat_id=chat_id, message_id=message_id,
+                        text=text, wait=wait, priority=PRIORITY_EDIT,
+                        coalesce_key=(chat_id, message_id), **kwargs)
@@ -0,0 +1,249 @@
+"""
+Outbound message scheduler respecting Telegram flood limits
+"""
+import asyncio
+from collections import OrderedDict, deque
+from telegram.error import RetryAfter
+from utils.token_bucket import TokenBucket
+from config.logging_config import logger
+
+# Priority lanes, lowest number first: replies to commands, notifications, live message edits
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFY = 1
+PRIORITY_EDIT = 2
+SEND_PRIORITIES = 3
+
+# Telegram allows about one message per second per chat and thirty per second overall
+CHAT_SEND_LIMIT = TokenBucket('chat', 1, 1.0)
+GLOBAL_SEND_LIMIT = TokenBucket('global', 30, 1.0)
+
+# Attempts after a RetryAfter before a send is given up
+SEND_MAX_RETRIES = 5
+
+# How long shutdown waits for queued messages to go out
+SEND_DRAIN_TIMEOUT = 5.0
+
+# Idle per-chat state is dropped this often
+SEND_PRUNE_INTERVAL = 60.0
+
+class _SendJob:
+    __slots__ = ('chat_id', 'func', 'args', 'kwargs', 'priority', 'key', 'futures', 'attempts', 'queued_at')
+
+    def __init__(self, chat_id, func, args, kwargs, priority, key, queued_at):
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.key = key
+        self.futures = []
+        self.attempts = 0
+        self.queued_at = queued_at
+
+class _ChatState:
+    __slots__ = ('bucket', 'paused_until', 'busy')
+
+    def __init__(self):
+        self.bucket = None
+        self.paused_until = 0.0
+        self.busy = False
+
+def _mark_retrieved(future: asyncio.Future):
+    """Keep asyncio from warning about failures of sends nobody awaited; the queue logs them"""
+    if not future.cancelled():
+        future.exception()
+
+class SendQueue:
+    """
+    Queues outbound Telegram calls and sends them as flood limits allow.
+    One call per chat is in flight at a time, so each chat's messages keep their order within a lane.
+    """
+
+    def __init__(self):
+        # One lane per priority: chat_id -> queued jobs, chats served round-robin
+        self._lanes = [OrderedDict() for _ in range(SEND_PRIORITIES)]
+        self._chats = {}
+        self._queued_edits = {}
+        self._global_bucket = None
+        self._wakeup = None
+        self._worker = None
+        self._deliveries = set()
+        self._last_prune = 0.0
+        self._stats = {'sent': 0, 'failed': 0, 'retries': 0, 'coalesced': 0, 'max_delay': 0.0}
+
+    def submit(self, chat_id: int, func, *args, priority: int = PRIORITY_REPLY, coalesce_key=None,
+               **kwargs) -> asyncio.Future:
+        """
+        Queue func(*args, **kwargs) and return a future for its result.
+        A queued call with the same coalesce_key is replaced instead, keeping its place in line.
+        """
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run(), name='send_queue')
+
+        future = loop.create_future()
+        future.add_done_callback(_mark_retrieved)
+
+        job = self._queued_edits.get(coalesce_key) if coalesce_key is not None else None
+        if job is not None:
+            job.args, job.kwargs = args, kwargs
+            job.futures.append(future)
+            self._stats['coalesced'] += 1
+            return future
+
+        job = _SendJob(chat_id, func, args, kwargs, priority, coalesce_key, loop.time())
+        job.futures.append(future)
+        if coalesce_key is not None:
+            self._queued_edits[coalesce_key] = job
+        self._lanes[priority].setdefault(chat_id, deque()).append(job)
+        self._wakeup.set()
+        return future
+
+    def _next_job(self, now: float):
+        """The next job allowed to go out, or None and how long until one might be"""
+        global_wait, global_bucket = GLOBAL_SEND_LIMIT.evaluate(self._global_bucket, now)
+        if global_wait > 0:
+            return None, global_wait
+
+        earliest = None
+        for lane in self._lanes:
+            for chat_id, jobs in lane.items():
+                state = self._chats.setdefault(chat_id, _ChatState())
+                if state.busy:
+                    continue
+                if state.paused_until > now:
+                    wait = state.paused_until - now
+                else:
+                    wait, chat_bucket = CHAT_SEND_LIMIT.evaluate(state.bucket, now)
+                if wait > 0:
+                    earliest = wait if earliest is None else min(earliest, wait)
+                    continue
+
+                job = jobs.popleft()
+                if jobs:
+                    lane.move_to_end(chat_id)
+                else:
+                    del lane[chat_id]
+                if self._queued_edits.get(job.key) is job:
+                    del self._queued_edits[job.key]
+                state.bucket = chat_bucket
+                state.busy = True
+                self._global_bucket = global_bucket
+                return job, None
+        return None, earliest
+
+    async def _run(self):
+        """Hand queued jobs to delivery tasks as the limits allow"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now - self._last_prune >= SEND_PRUNE_INTERVAL:
+                self._prune(now)
+
+            job, wait = self._next_job(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._stats['max_delay'] = max(self._stats['max_delay'], now - job.queued_at)
+            task = loop.create_task(self._deliver(job))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: _SendJob):
+        """Make one call, backing off and requeueing it on RetryAfter"""
+        state = self._chats[job.chat_id]
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+            state.paused_until = asyncio.get_running_loop().time() + seconds
+            job.attempts += 1
+            if job.attempts <= SEND_MAX_RETRIES:
+                self._stats['retries'] += 1
+                logger.warning(f"Flood control in chat {job.chat_id}, retrying in {seconds:.0f}s")
+                self._lanes[job.priority].setdefault(job.chat_id, deque()).appendleft(job)
+                # Later edits of the same message fold into the retried one again
+                if job.key is not None:
+                    self._queued_edits.setdefault(job.key, job)
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self._stats['sent'] += 1
+            for future in job.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            state.busy = False
+            self._wakeup.set()
+
+    def _fail(self, job: _SendJob, error: Exception):
+        """Pass a failure to everyone waiting on the job"""
+        self._stats['failed'] += 1
+        logger.warning(f"Send to chat {job.chat_id} failed: {error}")
+        for future in job.futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _prune(self, now: float):
+        """Forget chats with nothing queued or in flight whose limits have fully recovered"""
+        self._last_prune = now
+        queued = {chat_id for lane in self._lanes for chat_id in lane}
+        for chat_id in [
+            chat_id for chat_id, state in self._chats.items()
+            if chat_id not in queued and not state.busy and state.paused_until <= now
+            and (state.bucket is None or CHAT_SEND_LIMIT.expires_at(state.bucket) <= now)
+        ]:
+            del self._chats[chat_id]
+
+    def depth(self) -> int:
+        """Calls queued and not yet sent"""
+        return sum(len(jobs) for lane in self._lanes for jobs in lane.values())
+
+    def stats(self) -> dict:
+        """Queue depth per lane and delivery counters"""
+        return {
+            'queued': [sum(len(jobs) for jobs in lane.values()) for lane in self._lanes],
+            'in_flight': len(self._deliveries),
+            'sent': self._stats['sent'],
+            'failed': self._stats['failed'],
+            'retries': self._stats['retries'],
+            'coalesced': self._stats['coalesced'],
+            'max_delay_ms': self._stats['max_delay'] * 1000,
+        }
+
+    async def close(self, timeout: float = SEND_DRAIN_TIMEOUT):
+        """Give queued messages a chance to go out, then stop the scheduler"""
+        if self._worker is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.depth() or self._deliveries) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.depth():
+            logger.warning(f"Dropping {self.depth()} queued outbound messages at shutdown")
+
+        self._worker.cancel()
+        await asyncio.gather(self._worker, *self._deliveries, return_exceptions=True)
+        self._worker = None
+        for lane in self._lanes:
+            for jobs in lane.values():
+                for job in jobs:
+                    for future in job.futures:
+                        future.cancel()
+            lane.clear()
+        self._queued_edits.clear()
+
+send_queue = SendQueue()
+
+def get_send_queue_stats() -> dict:
+    """Outbound queue depth and delivery counters"""
+    return send_queue.stats()
@@ -0,0 +1,62 @@
+"""
+Token bucket and sliding window limits, shared by the rate limiter and the send queue
+"""
+import math
+from typing import Optional, Tuple
+
+class TokenBucket:
+    """Allow bursts of `capacity` calls, refilled evenly over `period` seconds"""
+    __slots__ = ('scope', 'capacity', 'period')
+
+    def __init__(self, scope: str, capacity: int, period: float):
+        self.scope = scope
+        self.capacity = capacity
+        self.period = period
+
+    def evaluate(self, state: Optional[tuple], now: float) -> Tuple[float, tuple]:
+        """Seconds until a call is allowed (0 if now) and the state after taking it"""
+        tokens, updated = state or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.capacity / self.period)
+        if tokens >= 1:
+            return 0.0, (tokens - 1, now)
+        return (1 - tokens) * self.period / self.capacity, (tokens, now)
+
+    def expires_at(self, state: tuple) -> float:
+        """When the bucket will have refilled, so forgetting it changes nothing"""
+        tokens, updated = state
+        return updated + (self.capacity - tokens) * self.period / self.capacity
+
+class SlidingWindow:
+    """Allow `limit` calls in any `window` seconds, estimated from two fixed windows"""
+    __slots__ = ('scope', 'limit', 'window')
+
+    def __init__(self, scope: str, limit: int, window: float):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def evaluate(self, state: Optional[tuple], now: float) -> Tuple[float, tuple]:
+        """Seconds until a call is allowed (0 if now) and the state after taking it"""
+        start = math.floor(now / self.window) * self.window
+        previous, count = 0, 0
+        if state:
+            last_start, last_count, last_previous = state
+            if last_start == start:
+                previous, count = last_previous, last_count
+            elif last_start == start - self.window:
+                previous = last_count
+
+        weight = 1 - (now - start) / self.window
+        if previous * weight + count + 1 <= self.limit:
+            return 0.0, (start, count + 1, previous)
+
+        # When the weighted estimate will have decayed enough for one more call
+        if count + 1 <= self.limit:
+            allowed_at = start + self.window * (1 - (self.limit - 1 - count) / previous)
+        else:
+            allowed_at = start + self.window * (2 - (self.limit - 1) / count)
+        return max(0.0, allowed_at - now), (start, count, previous)
+
+    def expires_at(self, state: tuple) -> float:
+        """When both windows the state counts will have passed"""
+        return state[0] + 2 * self.window
@@ -1,13 +1,14 @@
 """
 User helper utilities for automatic database management
 """
-from modules.database.models import upsert_user
+from modules.database import async_db
 
-def ensure_user_in_database(update):
+async def ensure_user_in_database(update):
     """
-    Ensure the user from the update is in the database
-    This should be called at the start of every command handler
+    Ensure the user from the update is in the database and return their record
+    Called once per update by the pre-dispatch stage, before any handler runs
     """
     user = update.effective_user
-    if user:
-        upsert_user(user.id, user.username, user.first_name, user.last_name)
\ No newline at end of file
+    if not user:
+        return None
+    return await async_db.ensure_user(user.id, user.username, user.first_name, user.last_name)